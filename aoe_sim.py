@@ -1,17 +1,32 @@
 from villager import Farmer, Lumberjack, GoldMiner, StoneMiner, Builder
-from queue import PriorityQueue
+from ruleset import DEFAULT_RULES
+from policy import make_policy
+from event_scheduler import make_scheduler
 from copy import deepcopy
-import matplotlib.pyplot as plt
+from time import perf_counter
 from constants import *
 
 
+SIMULATOR_VERSION = 2 # bump it when a change alters the results, so that stored results (result_store.py) are ignored
+
+
 class AoeSimulator:
 
-    def __init__(self, running_time = DEFAULT_RUNNING_TIME):
+    def __init__(self, running_time = DEFAULT_RUNNING_TIME, policy=None, rules=None, scheduler=None, wake_on_food=False):
 
         self.running_time = running_time
-        self.resources = {'food': INITIAL_FOOD, 'wood': INITIAL_WOOD, 'gold':INITIAL_GOLD, 'stone':INITIAL_STONE }
+        self.policy = make_policy(policy) # how new villagers are assigned, greedy (most needed resource) by default
+        self.rules = DEFAULT_RULES if rules is None else rules # costs, timings and gather rates, see ruleset.py
+        # the event queue: 'heap' (default) or 'calendar' (see event_scheduler.py), the results are the same
+        self.scheduler = 'heap' if scheduler is None else scheduler
+        # when the town center lacks food to train a villager, instead of trying again every try_train_villager_interval,
+        # wait until enough food is gathered and try again at the time the polling would have succeeded (same results,
+        # fewer events), the time of the failed try is kept in self.waiting_for_food
+        self.wake_on_food = wake_on_food
+        self.waiting_for_food = None
+        self.resources = dict(self.rules.initial_resources) # food, wood, gold, stone
         self.event_heap = None
+        self.reset_counters()
 
     def set_villager_sequence(self, villager_sequence : list):
         """
@@ -28,7 +43,7 @@ class AoeSimulator:
         """
 
         :param villager_sequence: takes the form [Forager(30), Forager(50), Forager(80), Lumberjack(110)]
-        :return: a priority queue of events (in form of tuples)
+        :return: an EventScheduler of events (in form of tuples)
         >>> a1 = AoeSimulator()
         >>> event_heap = a1.generate_event_heap([Farmer(0)])
         >>> event_heap.get()
@@ -40,27 +55,38 @@ class AoeSimulator:
         >>> event_heap.get()
         (128, 'food', 10)
         """
-        event_pq = PriorityQueue()
         if villager_sequence:
-            for villager in villager_sequence:
-                t0 = villager.init_time
-                tau = villager.work_interval
-                tn = self.running_time
-                if not isinstance(villager, Builder): # for resource collector
-                    time_list = [t0 + n * tau for n in range(1, (tn - t0)//tau)] # make sure time_list is within the total running time
-                    # also n start from range(1,...) because the first interval cannot gather food
-                    for t in time_list:
-                        event = (t, villager.resource_type, villager.max_capacity)
-                        event_pq.put(event) # priority queue inserts event, smallest time is always at front
-                else: # for builder
-                    if villager.building_type == 'house':
-                        event = (t0 + tau, 'house_completed', 0)
-                        event_pq.put(event)
-
+            event_pq = make_scheduler(self.scheduler)
+            self.add_villager_events(event_pq, villager_sequence)
             return event_pq
         else:
             print('Please input a villager training sequence.')
 
+    def add_villager_events(self, event_pq, villager_sequence):
+        # each resource collector takes a single periodic entry in event_pq instead of one entry per gather,
+        # so the setup cost is O(villagers) and only the events actually consumed are ever generated
+        events = []
+        for villager in villager_sequence:
+            t0 = villager.init_time
+            tau = villager.work_interval
+            if not isinstance(villager, Builder): # for resource collector
+                events.append(self.gatherer_event(villager.resource_type, t0, tau, villager.max_capacity))
+            else: # for builder
+                if villager.building_type == 'house':
+                    events.append((t0 + tau, 'house_completed', 0))
+        event_pq.put_many(events) # merge all the events into event_pq in one step
+
+    def gatherer_event(self, resource_type, t0, tau=None, max_capacity=None):
+        # the periodic event of a villager gathering resource_type from t0, rates from the ruleset by default
+        tau = self.rules.work_interval[resource_type] if tau is None else tau
+        max_capacity = self.rules.max_capacity[resource_type] if max_capacity is None else max_capacity
+        last_time = t0 + ((self.running_time - t0)//tau - 1) * tau # make sure all events are within the total running time
+        # also the first event is at t0 + tau because the first interval cannot gather food
+        return t0 + tau, resource_type, max_capacity, tau, last_time
+
+    def add_gatherer_events(self, event_pq, resource_type, t0):
+        event_pq.put_periodic(*self.gatherer_event(resource_type, t0))
+
     def process_event_pq(self, mode='fixed_time'):
         # this function is used when testing, and describes the fundamental structure of core function
         # later we expanded different types of events such as 'train_villager', 'build_house' based on this framework
@@ -79,13 +105,17 @@ class AoeSimulator:
 
         """
         shortest_time = True if mode == 'shortest_time' else False
+        if shortest_time:
+            self.count_goals_remaining()
 
         while not self.event_heap.empty():
             event = self.event_heap.get()
-            self.resources[event[1]] += event[2]
             if shortest_time: # in shortest_time mode, check whether requirements are met after processing each event
-                if self.met_resource_goal():
+                self.change_resource(event[1], event[2])
+                if self.goals_remaining == 0:
                     return event[0] # return the time of current event as end time
+            else:
+                self.resources[event[1]] += event[2]
 
     def set_resource_goal(self, goal_dict : dict):
         # input the requirement for each kind of resource
@@ -101,6 +131,22 @@ class AoeSimulator:
                 return False
         return True
 
+    def count_goals_remaining(self):
+        # number of resources still below the goal, change_resource keeps it up to date, so the event loops check
+        # the goal in O(1) instead of calling met_resource_goal after every event
+        # it has to be counted again whenever self.resources is replaced
+        self.goals_remaining = 0
+        for key in self.resources:
+            if self.resources[key] < self.resource_goal[key]:
+                self.goals_remaining += 1
+
+    def change_resource(self, key, amount):
+        goal = self.resource_goal[key]
+        was_met = self.resources[key] >= goal
+        self.resources[key] += amount
+        if (self.resources[key] >= goal) != was_met: # this resource just reached its goal, or fell below it
+            self.goals_remaining += 1 if was_met else -1
+
     def run(self, mode='fixed_time'):
         """
 
@@ -130,10 +176,13 @@ class AoeSimulator:
 
     # above is simple version which uses predefined event_heap
     # this is a model of single Town Center without the trivia of building house, farm exhaustion, etc
-    def simple_sim(self, num_villager):
+    def simple_sim(self, num_villager, trace=None, best_time=None):
         """
         Dynamically training villager and add to production sequence
         n_villager:  total number of villagers planned to train
+        trace: a callback trace(sim, time, event_description, amount) called after each event, see event_trace.py
+        best_time: stop as soon as the run cannot meet the goal before this time, the outcome is kept in self.status
+        (same as complex_sim)
         :return:
         >>> a1 = AoeSimulator()
         >>> a1.set_resource_goal({'food':500})
@@ -149,95 +198,136 @@ class AoeSimulator:
         {'food': 1000, 'wood': 200, 'gold': 100, 'stone': 0}
         The labor divison: {'food': 4, 'wood': 0, 'gold': 0, 'stone': 0}
         Goal achieved in 704 sec.
+        >>> a3 = AoeSimulator()
+        >>> a3.set_resource_goal({'food':1000})
+        >>> a3.simple_sim(3, best_time=650)
+        >>> a3.status
+        'pruned'
         """
-        init_villagers = [Farmer(0), Farmer(0), Farmer(0)] # each game start with 3 villagers, set them all to farming
+        self.reset_counters()
+        begin = perf_counter()
+        rules = self.rules
+        init_villagers = [Farmer(0, rules), Farmer(0, rules), Farmer(0, rules)] # each game start with 3 villagers, set them all to farming
         self.labor_division = {'food': 3, 'wood': 0, 'gold': 0, 'stone': 0 }  # use a dict to keep track of number of villager in each track
         self.resource_needed = self.resource_goal # in this version, resource_needed is just resource_goal
         self.event_heap = self.generate_event_heap(init_villagers) # generate event heap for first 3 villagers
         self.event_heap.put((0, 'try_train_villager', 0)) # always start training a villager at beginning
         # event form in event_heap : (time, event_description, amount)
+        self.pending_assignment = None
+        self.waiting_for_food = None
+        self.count_goals_remaining()
+        self.status = 'exhausted'
 
         while not self.event_heap.empty(): # main event loop
             event = self.event_heap.get()
             event_time, event_desc, event_amount = event  # rename for easier read : time , description and amount
 
             if event_desc in self.resources.keys(): # if this event related to gathering resources
-                self.resources[event_desc] += event_amount
-                if self.met_resource_goal(): # if reached the goal,  return the time of current event as end time
+                self.change_resource(event_desc, event_amount)
+                if self.goals_remaining == 0: # if reached the goal,  return the time of current event as end time
+                    if trace is not None:
+                        trace(self, event_time, event_desc, event_amount)
                     self.summary_print(event_time)
+                    self.status = 'goal_met'
                     break
+                if self.waiting_for_food is not None and event_desc == 'food':
+                    self.wake_town_center(event_time)
             elif event_desc == 'try_train_villager': # if this is a villager training event
-                if self.resources['food'] >= FOOD_COST_PER_VILLAGER :
-                    self.resources['food'] -= FOOD_COST_PER_VILLAGER # deduct 50 food to start training
-                    self.event_heap.put((event_time + VILLAGE_TRAINING_TIME, 'villager_trained', 0))
-                    # after VILLAGER_TRAINING_TIME, a new villager will be produced
-                else: # not enough food, wait TRY_AGAIN_VILLAGER_INTERVAL and try again
-                    self.event_heap.put((event_time + TRY_TRAIN_VILLAGER_INTERVAL, 'try_train_villager', 0))
+                if self.resources['food'] >= rules.food_cost_per_villager:
+                    self.change_resource('food', -rules.food_cost_per_villager) # deduct 50 food to start training
+                    self.event_heap.put((event_time + rules.villager_training_time, 'villager_trained', 0))
+                    # after villager_training_time, a new villager will be produced
+                elif self.wake_on_food:
+                    self.waiting_for_food = event_time
+                elif event_time < self.running_time: # not enough food, wait try_train_villager_interval and try again
+                    # (no gathering is left from the end of running time on, there the food is final and it stops)
+                    self.event_heap.put((event_time + rules.try_train_villager_interval, 'try_train_villager', 0))
             elif event_desc == 'villager_trained': # a new villager is trained now, assign him/her to a job
                 self.clever_assign_new_villager(event_time) # automatically decide new villager's task, generate its flow, and add to main event_heap
                 if sum(self.labor_division.values()) < num_villager: # if current total villagers is less than planned
                     self.event_heap.put((event_time, 'try_train_villager', 0)) # try training new villager
+                status = self.early_stop(num_villager, event_time, best_time, farm_wood=False)
+                if status is not None:
+                    self.status = status
+                    if trace is not None:
+                        trace(self, event_time, event_desc, event_amount)
+                    break
+            if trace is not None:
+                trace(self, event_time, event_desc, event_amount)
+        self.run_seconds = perf_counter() - begin
 
 
-    def clever_assign_new_villager(self, cur_time, consider_housing=False):
+    def clever_assign_new_villager(self, cur_time, consider_housing=False, resource=None):
 
         # cleverly assign villager to the "most needed place", for example, if food now is relatively enough and
         # wood is in dire need, new villager will be assigned as Lumberjack
         # consider_housing = True is used in complex_sim
+        # resource: assign the villager to this resource instead (still overridden by housing), used by the optimizer
+        # return the resource the villager is assigned to, or 'house' if he/she builds a house
 
-        eval_dict = {} # used to evaluate which of the resources is in most need
+        start = perf_counter()
+        if resource is not None:
+            most_needed_resource = resource
+        else:
+            most_needed_resource = self.policy.choose(self)
+
+        if consider_housing and self.need_house(): # if current pop near its max, override previous allocation
+            # house is the first consideration, housing if No.1 priority
+            self.change_resource('wood', -self.rules.wood_cost_per_house) # takes 25 wood to build a house
+            self.event_heap.put((cur_time + self.rules.build_time['house'], 'house_completed', 0))
+            most_needed_resource = 'house'
+        else:
+            self.labor_division[most_needed_resource] += 1
+            if consider_housing:
+                self.resource_needed['wood'] = self.resource_goal['wood'] + self.calc_wood_overhead()  # increase demand for wood
+            self.add_gatherer_events(self.event_heap, most_needed_resource, cur_time) # add the new villager's flow directly to main event_heap
 
-        for key in self.resources.keys(): # for each type of resource, calculate its needed_score
+        # print("A new villager is assigned to %s at time %d" % (most_needed_resource, cur_time))
+        self.num_assignments += 1
+        self.assignment_seconds += perf_counter() - start
+        return most_needed_resource
+
+    def most_needed_resource(self):
+        # the resource with largest evaluation score, this is the greedy policy
+        most_needed_resource, largest_score = None, None
+        for key in self.resources: # for each type of resource, calculate its needed_score
             goal = self.resource_needed[key]
             current = self.resources[key]
             num_worker = self.labor_division[key]
             if goal == 0:
-                eval_dict[key] = 0
+                score = 0
             else:
                 if num_worker != 0:
-                    eval_dict[key] = int((goal - current) / num_worker)
+                    score = int((goal - current) / num_worker)
                 else:
-                    eval_dict[key] = goal - current
-
-        # get most needed type of resource, and create a new villager
-        most_needed_resource = max(eval_dict, key=eval_dict.get) # find the resource type with largest evaluation score
-
-        new_villager_dict = {'food': Farmer(cur_time), 'wood':Lumberjack(cur_time), 'gold':GoldMiner(cur_time), 'stone':StoneMiner(cur_time)}
-
-        new_villager = new_villager_dict[most_needed_resource]
-        temp_event_heap = self.generate_event_heap([new_villager])
-
-        if consider_housing: # if consider housing, and current pop near its max, override previous allocation
-            cur_population = sum(self.labor_division.values())
-            # house is the first consideration
-            if self.num_accommodation - cur_population == 2 and cur_population >= 8:
-                # cur_population >= 8 means not right beginning of game, where we already manually assigned a villager to build house
-                temp_event_heap = self.generate_event_heap([Builder(cur_time, 'house')]) # housing if No.1 priority
-                self.resources['wood'] -= WOOD_COST_PER_HOUSE # takes 25 wood to build a house
-            else: # stick to original allocation
-                self.labor_division[most_needed_resource] += 1
-                self.resource_needed['wood'] = self.resource_goal['wood'] + self.calc_wood_overhead()  # increase demand for wood
-        else:
-            self.labor_division[most_needed_resource] += 1
-        # pour from temp event heap to main event heap
+                    score = goal - current
+            if largest_score is None or score > largest_score: # the first one wins a tie
+                most_needed_resource, largest_score = key, score
+        return most_needed_resource
 
-        while not temp_event_heap.empty():
-            event = temp_event_heap.get()
-            # print(event)
-            self.event_heap.put(event)
-
-        # print("A new villager is assigned to %s at time %d" % (most_needed_resource, cur_time))
+    def need_house(self):
+        # current population near its max, the next villager should build a house
+        cur_population = sum(self.labor_division.values())
+        # cur_population >= 8 means not right beginning of game, where we already manually assigned a villager to build house
+        return self.num_accommodation - cur_population == 2 and cur_population >= 8
 
     def calc_wood_overhead(self):
         # self-define the wood overhead, since building farm requires wood, we'll later combine this with resource_goal to resource_needed
-        return self.labor_division['food'] * WOOD_COST_PER_FARM + 200 # each farm takes 60 wood (one farmer works on one farm), and set 200 for other buildings
+        return self.labor_division['food'] * self.rules.wood_cost_per_farm + self.rules.wood_for_other_buildings # each farm takes 60 wood (one farmer works on one farm), and set 200 for other buildings
 
-    def complex_sim(self, num_villager, return_value=False):
+    def complex_sim(self, num_villager, return_value=False, verbose=True, cache=None, trace=None, best_time=None):
         """
         This version added the requirement of house for population
         also the farm will exhaust "continuously" (automatically deduct 2.5 unit of wood for every 10 unit of food collected)
         Dynamically training villager, add to production sequence
         num_villager:  total number of villagers planned to train
+        verbose: print the summary when the goal is met, turn it off when running sweeps
+        cache: a SimulationCache, runs with different num_villager then only simulate the tail after their shared prefix
+        trace: a callback trace(sim, time, event_description, amount) called after each event, see event_trace.py
+        (events replayed from the cache are not traced)
+        best_time: stop as soon as the run cannot meet the goal before this time
+        the outcome is kept in self.status: 'goal_met', 'infeasible' (the goal can no longer be met within running_time,
+        the run stops at that point), 'pruned' (cannot beat best_time) or 'exhausted'
         >>> a1 = AoeSimulator()
         >>> a1.set_resource_goal({'food':1000, 'gold':800})
         >>> a1.complex_sim(10)
@@ -262,44 +352,314 @@ class AoeSimulator:
         The labor divison: {'food': 11, 'wood': 6, 'gold': 3, 'stone': 0}
         Goal achieved in 769 sec.
 
+        >>> a1 = AoeSimulator()
+        >>> a1.set_resource_goal({'food':1000, 'gold':800})
+        >>> a1.complex_sim(20, return_value=True, verbose=False, best_time=700), a1.status
+        (None, 'pruned')
+        >>> a1 = AoeSimulator()
+        >>> a1.set_resource_goal({'stone':20000})
+        >>> a1.complex_sim(10, return_value=True), a1.status, a1.stats()['events_processed']
+        (None, 'infeasible', 53)
+        >>> a2 = AoeSimulator(500) # a short game, the town center is short of food when gathering ends
+        >>> a2.set_resource_goal({'food':100, 'gold':1000})
+        >>> a2.complex_sim(49, return_value=True), a2.status
+        (None, 'exhausted')
         """
-        self.num_accommodation = INITIAL_ACCOMMO # initiallty a town center can accommodate 5 people
-        init_villagers = [Farmer(0), Farmer(0), Builder(0, 'house')] # each game start with 3 villagers, set them all to farming
-        self.resources['wood'] -= WOOD_COST_PER_HOUSE # cost for build house at the beginning
+        self.reset_counters()
+        begin = perf_counter()
+        chain = cache.get_chain(self) if cache is not None else None
+        start = cache.resume_point(chain, num_villager) if chain else None
+        # this run extends the cached chain of snapshots as long as it keeps training villagers
+        recording = chain is not None and (start is None or (start == len(chain) - 1 and chain[start][0] < num_villager))
+        if start is not None:
+            # the run without cache checks early stop at every decision and house on the way, the chain keeps the
+            # state of each check: if one stops this run, resume right before it, so that the run stops there too
+            for i in range(start + 1):
+                if any(self.early_stop(num_villager, check_time, best_time, progress=progress)
+                       for check_time, progress in chain[i][3]):
+                    start, recording = (i - 1 if i else None), False
+                    break
+        checks = []
+        if start is None: # simulate from the beginning of the game
+            self.setup_complex_sim()
+        else: # resume from a cached snapshot, taken right before deciding whether to train another villager
+            population, decision_time, snapshot, _ = chain[start]
+            self.restore(snapshot)
+            if population < num_villager:
+                self.event_heap.put((decision_time, 'try_train_villager', 0))
+            # the uncached run checks early stop right after this decision, so must the resumed one
+            progress = self.record_check(checks, decision_time) if recording else None
+            self.status = self.early_stop(num_villager, decision_time, best_time, progress=progress)
+            if self.status is not None:
+                self.run_seconds = perf_counter() - begin
+                return
+
+        status, event_time = self.process_complex_events(num_villager, chain if recording else None, trace=trace,
+                                                         best_time=best_time, checks=checks)
+        self.run_seconds = perf_counter() - begin
+        self.status = status
+        if status == 'goal_met': # return the time of the event where the goal is reached as end time
+            if verbose:
+                self.summary_print(event_time)
+            if return_value:
+                return event_time
+
+    def setup_complex_sim(self):
+        # the state at the beginning of the game in complex_sim
+        rules = self.rules
+        self.num_accommodation = rules.initial_accommodation # initiallty a town center can accommodate 5 people
+        init_villagers = [Farmer(0, rules), Farmer(0, rules), Builder(0, 'house', rules)] # each game start with 3 villagers, set them all to farming
+        self.resources['wood'] -= rules.wood_cost_per_house # cost for build house at the beginning
         self.labor_division = {'food': 3, 'wood': 0, 'gold': 0, 'stone': 0} # use a dict to keep track of number of villager in each track
         self.resource_needed = deepcopy(self.resource_goal) # temporarily, the needed is goal, but soon needed is >> goal
         # because, e.g, it takes wood to build farm, though wood may not be needed in final goal
         self.event_heap = self.generate_event_heap(init_villagers) # generate event heap for first 3 villagers
         self.event_heap.put((0, 'try_train_villager', 0)) # always start training a villager at beginning
         # event form in event_heap : (time, event_description, amount)
-
+        self.pending_assignment = None
+        self.waiting_for_food = None
+        self.count_goals_remaining()
+
+    def wake_town_center(self, cur_time):
+        # food was gathered while the town center waits for it (wake_on_food), once there is enough, schedule the
+        # try_train_villager at the first retry time of the polling from now on: food only grows while waiting,
+        # so the polling would have failed until then, and succeeded there
+        if self.resources['food'] >= self.rules.food_cost_per_villager:
+            interval = self.rules.try_train_villager_interval
+            retry_time = self.waiting_for_food + -(-(cur_time - self.waiting_for_food) // interval) * interval
+            self.event_heap.put((retry_time, 'try_train_villager', 0))
+            self.waiting_for_food = None
+
+    def process_complex_events(self, num_villager, chain=None, stop_at_decision=False, trace=None, best_time=None,
+                               checks=None):
+        # main event loop of complex_sim
+        # chain: a list to record snapshots right before each "train another villager?" decision (see SimulationCache)
+        # checks: the early stop checks since the last snapshot of chain, kept with the next snapshot
+        # stop_at_decision: stop when a new villager is to be assigned to a resource (not when a house must be built),
+        # the assignment is left pending until assign_pending_villager, so a search can try every choice from here
+        # after each assignment the goal is checked against projected_finish_time, so the loop stops early
+        # return ('goal_met', time) if goal is reached, ('decision', time) if stopped at a decision,
+        # ('infeasible', time) / ('pruned', time) if the goal cannot be met within running_time / before best_time,
+        # or ('exhausted', None) if no event is left
+        rules = self.rules
+        checks = [] if checks is None else checks
         while not self.event_heap.empty(): # main event loop
             event = self.event_heap.get()
             event_time, event_desc, event_amount = event  # rename for easier read : time , description and amount
             if event_desc in self.resources.keys(): # if this event related to gathering resouces
-                self.resources[event_desc] += event_amount
+                self.change_resource(event_desc, event_amount)
                 if event_desc == 'food':
-                    self.resources['wood'] -= WOOD_COST_PER_ONE_UNIT_FOOD * event_amount # let's suppose farm takes 1 wood for 4 food
-                if self.met_resource_goal(): # if reached the goal,  return the time of current event as end time
-                    self.summary_print(event_time) # event[0] is current time
-                    if return_value:
-                        return event_time
-                    break
+                    self.change_resource('wood', -rules.wood_cost_per_food * event_amount) # let's suppose farm takes 1 wood for 4 food
+                if self.goals_remaining == 0: # if reached the goal,  return the time of current event as end time
+                    if trace is not None:
+                        trace(self, event_time, event_desc, event_amount)
+                    return 'goal_met', event_time
+                if self.waiting_for_food is not None and event_desc == 'food':
+                    self.wake_town_center(event_time)
             elif event_desc == 'try_train_villager': # if this is a villager training event
-                if self.resources['food'] >= FOOD_COST_PER_VILLAGER :
-                    self.resources['food'] -= FOOD_COST_PER_VILLAGER # deduct 50 food to start training
-                    self.event_heap.put((event_time + VILLAGE_TRAINING_TIME, 'villager_trained', 0))
-                    # after VILLAGER_TRAINING_TIME, a new villager will be produced
-                else: # not enough food, wait TRY_AGAIN_VILLAGER_INTERVAL and try again
-                    self.event_heap.put((event_time + TRY_TRAIN_VILLAGER_INTERVAL, 'try_train_villager', 0))
+                if self.resources['food'] >= rules.food_cost_per_villager:
+                    self.change_resource('food', -rules.food_cost_per_villager) # deduct 50 food to start training
+                    self.event_heap.put((event_time + rules.villager_training_time, 'villager_trained', 0))
+                    # after villager_training_time, a new villager will be produced
+                elif self.wake_on_food:
+                    self.waiting_for_food = event_time
+                elif event_time < self.running_time: # not enough food, wait try_train_villager_interval and try again
+                    # (no gathering is left from the end of running time on, there the food is final and it stops)
+                    self.event_heap.put((event_time + rules.try_train_villager_interval, 'try_train_villager', 0))
             elif event_desc == 'villager_trained': # a new villager is trained now, assign him/her to a job
+                if stop_at_decision and not self.need_house():
+                    self.pending_assignment = (event_time, event_desc)
+                    return 'decision', event_time
                 self.clever_assign_new_villager(event_time, consider_housing=True) # automatically decide new villager's task, generate its flow, and add to main event_heap
-                if sum(self.labor_division.values()) < num_villager: # if current total villagers is less than planned
+                population = sum(self.labor_division.values())
+                if chain is not None: # runs with more villagers share the history up to this decision
+                    chain.append((population, event_time, self.snapshot(), checks))
+                    checks = []
+                    if population >= num_villager: # from here on, this run diverges from the runs with more villagers
+                        chain = None
+                if population < num_villager: # if current total villagers is less than planned
                     self.event_heap.put((event_time, 'try_train_villager', 0)) # try training new villager
+                progress = self.record_check(checks, event_time) if chain is not None else None
+                status = self.early_stop(num_villager, event_time, best_time, progress=progress)
+                if status is not None:
+                    if trace is not None:
+                        trace(self, event_time, event_desc, event_amount)
+                    return status, event_time
             elif event_desc == 'house_completed': # indicate a house is done
-                self.num_accommodation += ACCOMMO_PER_HOUSE # a house provide 5 accommodation
+                self.num_accommodation += rules.accommodation_per_house # a house provide 5 accommodation
+                if stop_at_decision and not self.need_house():
+                    self.pending_assignment = (event_time, event_desc)
+                    return 'decision', event_time
                 self.clever_assign_new_villager(event_time, consider_housing=True)
-
+                progress = self.record_check(checks, event_time) if chain is not None else None
+                status = self.early_stop(num_villager, event_time, best_time, progress=progress)
+                if status is not None:
+                    if trace is not None:
+                        trace(self, event_time, event_desc, event_amount)
+                    return status, event_time
+            if trace is not None:
+                trace(self, event_time, event_desc, event_amount)
+        return 'exhausted', None
+
+    def assign_pending_villager(self, num_villager, resource):
+        # finish the assignment where process_complex_events stopped, with the resource chosen by the caller
+        event_time, event_desc = self.pending_assignment
+        self.pending_assignment = None
+        self.clever_assign_new_villager(event_time, consider_housing=True, resource=resource)
+        if event_desc == 'villager_trained' and sum(self.labor_division.values()) < num_villager:
+            self.event_heap.put((event_time, 'try_train_villager', 0)) # try training new villager
+
+    def projected_finish_time(self, num_villager, cur_time, farm_wood=True, progress=None):
+        """
+        A lower bound of the time the goal can be met from the current state, None if not within running_time
+        it relaxes the rules: nothing is spent any more (but the wood of farms for the food still needed, if farm_wood),
+        the current gatherers gather at their rates, and every villager still to come (the pending one, builders and
+        villagers in training now, and the rest trained back to back) may be split between resources
+        progress: the state the bound is taken from, as returned by self.progress(), the current state if None
+        >>> a1 = AoeSimulator()
+        >>> a1.set_resource_goal({'food':1000, 'gold':800})
+        >>> a1.setup_complex_sim()
+        >>> a1.projected_finish_time(10, 0), a1.projected_finish_time(30, 0)
+        (416, 388)
+        >>> a1.set_resource_goal({'food':20000}) # wood for the farms, with 2 farmers and a builder only
+        >>> a1.projected_finish_time(3, 0) is None
+        True
+        """
+        work_interval, max_capacity, training_time = self.rules.work_interval, self.rules.max_capacity, \
+            self.rules.villager_training_time
+        resources, labor_division, num_trained, num_builders, num_now, training = \
+            self.progress() if progress is None else progress
+        shortage = {key: self.resource_goal[key] - resources[key] for key in resources}
+        if all(value <= 0 for value in shortage.values()):
+            return cur_time
+        food_loads = max(0, -(-shortage['food'] // max_capacity['food'])) # food to gather at least
+        wood_per_load = self.rules.wood_cost_per_food * max_capacity['food'] if farm_wood else 0
+        shortage['wood'] += wood_per_load * food_loads
+        loads_needed = [(work_interval[key], labor_division[key], -(-shortage[key] // max_capacity[key]))
+                        for key in shortage if shortage[key] > 0]
+        num_later = 0
+        if training:
+            # training goes on while the population is below num_villager, builders are not counted in it, and
+            # the villagers trained while houses are being built (2 at most) build one too, so they are extra
+            num_later = max(0, num_villager - sum(labor_division.values()) - num_now + num_builders) \
+                + num_builders + 2
+
+        def reachable(end_time):
+            # villager-seconds needed beyond what the current gatherers bring, against what the new villagers have
+            span = end_time - cur_time
+            work_needed = 0
+            for tau, num_worker, loads in loads_needed:
+                loads_left = loads - num_worker * (span // tau + 1)
+                if loads_left > 0:
+                    work_needed += loads_left * tau
+            k = min(num_later, span // training_time) # villagers trained back to back after now
+            return work_needed <= (num_now + k) * span - training_time * k * (k + 1) // 2
+
+        low, high = cur_time, self.running_time
+        if high < low or not reachable(high):
+            return None
+        while low < high: # binary search for the first reachable time
+            mid = (low + high) // 2
+            if reachable(mid):
+                high = mid
+            else:
+                low = mid + 1
+
+        # with no villager to come, farmers keep farming after the food goal is met: if they burn wood faster than
+        # the lumberjacks bring it, the most wood there can be (farmers gather 2 loads less and lumberjacks 1 more
+        # than their rates) grows until the food still needed is gathered, then goes down, so take its maximum
+        num_farmers = labor_division['food'] - 1 # setup_complex_sim counts the first builder as a farmer
+        num_lumberjacks = labor_division['wood']
+        wood_rate = max_capacity['wood'] * num_lumberjacks / work_interval['wood']
+        if wood_per_load and num_now + num_later == 0 and num_farmers > 0 and \
+                wood_rate <= wood_per_load * num_farmers / work_interval['food']:
+            span = max(low - cur_time, work_interval['food'] * (food_loads / num_farmers + 2))
+            span = min(span, self.running_time - cur_time)
+            most_wood = (resources['wood'] + max_capacity['wood'] * num_lumberjacks
+                         + wood_rate * span - wood_per_load * max(food_loads, num_farmers * (span / work_interval['food'] - 2)))
+            if most_wood < self.resource_goal['wood']:
+                return None
+        return low
+
+    def progress(self):
+        # what projected_finish_time needs of the current state: (resources, labor_division, villagers in training,
+        # builders, villagers to assign now, whether training goes on), the dicts are not copied
+        pending = self.event_heap.pending()
+        num_trained = sum(1 for entry in pending if entry[3] == 'villager_trained')
+        num_builders = sum(1 for entry in pending if entry[3] == 'house_completed')
+        num_now = (self.pending_assignment is not None) + num_trained + num_builders
+        training = bool(num_trained or self.waiting_for_food is not None
+                        or any(entry[3] == 'try_train_villager' for entry in pending)
+                        or (self.pending_assignment is not None and self.pending_assignment[1] == 'villager_trained'))
+        return self.resources, self.labor_division, num_trained, num_builders, num_now, training
+
+    def record_check(self, checks, cur_time):
+        # keep a copy of the state of an early stop check in checks (see complex_sim) and return it
+        resources, labor_division, *counts = self.progress()
+        checks.append((cur_time, (dict(resources), dict(labor_division), *counts)))
+        return checks[-1][1]
+
+    def early_stop(self, num_villager, cur_time, best_time=None, farm_wood=True, progress=None):
+        # 'infeasible' if the goal can no longer be met within running_time, 'pruned' if not before best_time,
+        # None if the run should go on, progress as in projected_finish_time
+        start = perf_counter()
+        bound = self.projected_finish_time(num_villager, cur_time, farm_wood, progress)
+        self.early_stop_seconds += perf_counter() - start
+        if bound is None:
+            return 'infeasible'
+        if best_time is not None and bound >= best_time:
+            return 'pruned'
+        return None
+
+    def snapshot(self):
+        # copy of the whole simulation state, so that the simulation can be resumed from here later
+        return {'resources': dict(self.resources), 'labor_division': dict(self.labor_division),
+                'num_accommodation': self.num_accommodation, 'resource_needed': dict(self.resource_needed),
+                'event_heap': self.event_heap.copy(), 'pending_assignment': self.pending_assignment,
+                'waiting_for_food': self.waiting_for_food}
+
+    def restore(self, snapshot):
+        # the snapshot is copied again, so it can be restored any number of times
+        self.resources = dict(snapshot['resources'])
+        self.labor_division = dict(snapshot['labor_division'])
+        self.num_accommodation = snapshot['num_accommodation']
+        self.resource_needed = dict(snapshot['resource_needed'])
+        self.event_heap = snapshot['event_heap'].copy()
+        self.pending_assignment = snapshot['pending_assignment']
+        self.waiting_for_food = snapshot['waiting_for_food']
+        self.count_goals_remaining()
+
+    def reset_counters(self):
+        # the time counters of stats(), simple_sim and complex_sim start them again
+        self.num_assignments = 0
+        self.assignment_seconds = 0.0 # in clever_assign_new_villager, the policy included
+        self.early_stop_seconds = 0.0 # in early_stop, i.e. projected_finish_time
+        self.run_seconds = 0.0 # the whole simple_sim or complex_sim
+
+    def stats(self):
+        """
+        Lightweight counters of the last simulation, for profiling: events processed, the largest and the current size
+        of the event queue, the assignments of new villagers and the seconds spent on them and on the early stop checks,
+        the rest of the run is the handling of gather events (and of the few training and house events)
+        >>> sim = AoeSimulator()
+        >>> sim.stats()['events_processed'], sim.stats()['assignments']
+        (0, 0)
+        >>> sim.set_resource_goal({'food':1000, 'gold':800})
+        >>> sim.complex_sim(10, verbose=False)
+        >>> stats = sim.stats()
+        >>> stats['events_processed'], stats['assignments']
+        (296, 8)
+        >>> stats['run_seconds'] >= stats['assignment_seconds'] + stats['early_stop_seconds']
+        True
+        """
+        heap = self.event_heap
+        gather_seconds = max(0.0, self.run_seconds - self.assignment_seconds - self.early_stop_seconds)
+        return {'events_processed': 0 if heap is None else heap.num_events,
+                'max_heap_size': 0 if heap is None else heap.max_size,
+                'pending_events': 0 if heap is None else len(heap),
+                'assignments': self.num_assignments, 'assignment_seconds': self.assignment_seconds,
+                'early_stop_seconds': self.early_stop_seconds, 'gather_seconds': gather_seconds,
+                'run_seconds': self.run_seconds}
 
     def summary_print(self, current_time):
         # You can customize the level of detail of the information you want here
@@ -310,30 +670,16 @@ class AoeSimulator:
         print("Goal achieved in %d sec." % current_time)
 
 
-    def draw_graph(self, resource_goal, num_villager_range: tuple = (5,30)):
+    def draw_graph(self, resource_goal, num_villager_range: tuple = (5,30), max_workers=None, store=None):
         # generate statistical graph for completion time versus the number of villagers
-
-        def generate_graph_title(): # generate title for the graph
-            begin = 'The time of generating '
-            temp_list = []
-            for key in resource_goal:
-                if resource_goal[key] != 0:
-                    temp_list.append( str(resource_goal[key]) + ' ' + key)
-            return begin + ','.join(temp_list)
-
+        # the simulations are run in parallel by run_sweep, max_workers=1 runs them in this process
+        # store: a ResultStore (result_store.py), only the villager counts not in it yet are simulated
+        from sweep import run_sweep # imported here since sweep itself imports this module
+        from plotting import plot_finish_times # matplotlib is only loaded when a graph is drawn
         low, high = num_villager_range
-        time_list = []
-        for n_villager in range(low, high + 1):
-            sim1 = AoeSimulator()
-            sim1.set_resource_goal(resource_goal)
-            time_took = sim1.complex_sim(n_villager, return_value=True)
-            time_list.append(time_took)
-
-        plt.title(generate_graph_title())
-        plt.xlabel('num_villager')
-        plt.ylabel('time_spent')
-        plt.plot(range(low, high + 1), time_list)
-        plt.show()
+        result_table = run_sweep([resource_goal], range(low, high + 1), max_workers=max_workers, store=store)
+        time_list = [row['finish_time'] for row in result_table]
+        plot_finish_times(resource_goal, range(low, high + 1), time_list)
 
 
 if __name__ == '__main__':
@@ -343,8 +689,10 @@ if __name__ == '__main__':
     resource_goal = {'food': 5000, 'wood':4000, 'gold':4000, 'stone':1500 }
     # resource_goal = {'food':1000, 'gold':800}
 
-    sim1 = AoeSimulator()
-    sim1.draw_graph(resource_goal, (min_villager, max_villager))
+    from result_store import ResultStore
+    with ResultStore('sweep_results.sqlite') as store: # the next run reuses the results
+        sim1 = AoeSimulator()
+        sim1.draw_graph(resource_goal, (min_villager, max_villager), store=store)
 
 
     # single_towncenter simulation
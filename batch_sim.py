@@ -0,0 +1,177 @@
+import numpy as np
+from ruleset import DEFAULT_RULES, RESOURCE_TYPES
+from constants import *
+
+
+FOOD, WOOD, GOLD, STONE = range(4) # columns in the order of RESOURCE_TYPES, the same as AoeSimulator.resources
+
+
+class BatchSimulator:
+    """
+    Run many simple_sim/complex_sim configurations at once on a shared time grid of one second
+    gather events are strictly periodic (t0 + n * work_interval), so each villager is only counted in a table
+    [config, resource, t0 % work_interval], and at second t all the villagers of a resource gather together,
+    events at the same second are processed in the same order as the event heap of AoeSimulator,
+    so the results are identical to the scalar simulator
+    >>> batch = BatchSimulator()
+    >>> batch.run([{'food':1000, 'gold':800}] * 3, [10, 15, 20])
+    array([960, 800, 769])
+    >>> batch.labor_division[1].tolist()
+    [8, 4, 3, 0]
+    >>> batch.resources[0].tolist()
+    [1000.0, 535.0, 1140.0, 0.0]
+    >>> batch.run([{'food':500}, {'food':1000}], 3, mode='simple')
+    array([288, 704])
+    """
+
+    def __init__(self, running_time=DEFAULT_RUNNING_TIME, rules=None):
+        self.running_time = running_time
+        self.rules = DEFAULT_RULES if rules is None else rules # see ruleset.py
+        self.work_interval = self.rules.work_intervals # per resource, in the order of RESOURCE_TYPES
+        self.max_capacity = self.rules.max_capacities
+        self.house_time = self.rules.build_time['house']
+
+    def run(self, resource_goals, num_villagers, mode='complex'):
+        """
+        :param resource_goals: a list of goal dicts like in set_resource_goal, or an array of shape (n_config, 4)
+        with columns in the order of RESOURCE_TYPES
+        :param num_villagers: total number of villagers planned to train, one per config or a single int for all
+        :param mode: 'complex' (houses and farm wood cost, like complex_sim) or 'simple' (like simple_sim)
+        :return: an int array of finish time per config, -1 if the goal is not met within running_time
+        the final resources and labor division are kept in self.resources and self.labor_division
+        """
+        if isinstance(resource_goals, np.ndarray):
+            goal = resource_goals.astype(float)
+        else:
+            goal = np.array([[g.get(key, 0) for key in RESOURCE_TYPES] for g in resource_goals], dtype=float)
+        n_config = len(goal)
+        target = np.broadcast_to(np.asarray(num_villagers), (n_config,))
+        complex_mode = mode == 'complex'
+        rules = self.rules
+
+        self.resource_goal = goal
+        self.resources = np.tile(np.array(list(rules.initial_resources.values()), dtype=float), (n_config, 1))
+        self.labor_division = np.zeros((n_config, 4), dtype=int)
+        self.labor_division[:, FOOD] = 3
+        self.resource_needed = goal.copy()
+        self.num_accommodation = np.full(n_config, rules.initial_accommodation)
+        self.finish_time = np.full(n_config, -1)
+        self.active = np.ones(n_config, dtype=bool)
+        # number of gatherers of each resource, indexed by the phase t0 % work_interval of their gather events
+        self.gatherers = [np.zeros((n_config, tau), dtype=int) for tau in self.work_interval]
+        self.new_gatherers = [] # villagers assigned during the current second, they start counting from next second
+        self.houses = np.zeros((n_config, self.house_time + 1), dtype=int) # ring buffer of houses completed at t
+        self.next_try = np.zeros(n_config, dtype=int) # time of the pending try_train_villager, -1 if none
+        self.next_trained = np.full(n_config, -1) # time of the pending villager_trained, -1 if none
+
+        all_rows = np.arange(n_config)
+        if complex_mode: # two farmers and a house builder at the beginning
+            self.new_gatherers.append((all_rows, FOOD, 0, 2))
+            self.resources[:, WOOD] -= rules.wood_cost_per_house
+            self.houses[:, self.house_time % (self.house_time + 1)] = 1
+        else: # three farmers at the beginning
+            self.new_gatherers.append((all_rows, FOOD, 0, 3))
+        wood_per_food = rules.wood_cost_per_food if complex_mode else 0
+
+        last_gather_time = self.running_time - min(self.work_interval) # no villager gathers after this time
+        for t in range(last_gather_time + 1):
+            # same order as the event heap: food, gold, house_completed, stone, try_train_villager, villager_trained, wood
+            self.gather(t, FOOD, wood_per_food)
+            self.gather(t, GOLD)
+            if complex_mode:
+                self.complete_houses(t)
+            self.gather(t, STONE)
+            self.try_train_villager(np.flatnonzero(self.active & (self.next_try == t)), t)
+            trained = np.flatnonzero(self.active & (self.next_trained == t))
+            if trained.size:
+                self.next_trained[trained] = -1
+                self.assign_new_villager(trained, t, complex_mode)
+                trained = trained[self.labor_division[trained].sum(axis=1) < target[trained]]
+                self.try_train_villager(trained, t)
+            self.gather(t, WOOD)
+            self.add_new_gatherers()
+            if not self.active.any():
+                break
+        return self.finish_time
+
+    def add_new_gatherers(self):
+        # the villagers assigned during this second, in form of (rows, resource, t0, number of villagers per row)
+        for rows, resource, t0, amount in self.new_gatherers:
+            np.add.at(self.gatherers[resource], (rows, t0 % self.work_interval[resource]), amount)
+        self.new_gatherers = []
+
+    def gathering_rows(self, t, resource):
+        # configs that have gather events of this resource at second t, and how many villagers gather
+        tau = self.work_interval[resource]
+        if t + tau > self.running_time: # the villager's last gather must be within the total running time
+            return np.empty(0, dtype=int), np.empty(0, dtype=int)
+        num_gatherers = self.gatherers[resource][:, t % tau]
+        rows = np.flatnonzero(self.active & (num_gatherers > 0))
+        return rows, num_gatherers[rows]
+
+    def gather(self, t, resource, wood_per_food=0):
+        # the goal is checked after every single gather event, the gathered resource only increases during the batch
+        # (and wood only decreases for food), so the goal is met somewhere in the batch only if it is met at the
+        # first event j where the gathered resource is enough, finished configs stop updating from then on
+        rows, num_gatherers = self.gathering_rows(t, resource)
+        if not rows.size:
+            return
+        amount = self.max_capacity[resource]
+        first = np.maximum(1, np.ceil((self.resource_goal[rows, resource] - self.resources[rows, resource]) / amount))
+        num_events = num_gatherers.astype(float)
+        maybe = np.flatnonzero(first <= num_gatherers) # only these can meet the goal in this batch
+        if maybe.size:
+            met_rows = rows[maybe]
+            after = self.resources[met_rows]
+            after[:, resource] += amount * first[maybe]
+            after[:, WOOD] -= wood_per_food * amount * first[maybe]
+            met = (after >= self.resource_goal[met_rows]).all(axis=1)
+            num_events[maybe[met]] = first[maybe[met]]
+            self.finish_time[met_rows[met]] = t
+            self.active[met_rows[met]] = False
+        self.resources[rows, resource] += amount * num_events
+        if wood_per_food:
+            self.resources[rows, WOOD] -= wood_per_food * amount * num_events
+
+    def complete_houses(self, t):
+        slot = t % self.houses.shape[1]
+        num_houses = self.houses[:, slot].copy()
+        self.houses[:, slot] = 0
+        for i in range(num_houses.max()): # several houses completed at the same second are handled one by one
+            rows = np.flatnonzero(self.active & (num_houses > i))
+            self.num_accommodation[rows] += self.rules.accommodation_per_house
+            self.assign_new_villager(rows, t, consider_housing=True)
+
+    def try_train_villager(self, rows, t):
+        rules = self.rules
+        can_train = self.resources[rows, FOOD] >= rules.food_cost_per_villager
+        training = rows[can_train]
+        self.resources[training, FOOD] -= rules.food_cost_per_villager
+        self.next_trained[training] = t + rules.villager_training_time
+        self.next_try[training] = -1
+        self.next_try[rows[~can_train]] = t + rules.try_train_villager_interval # not enough food, try again later
+
+    def assign_new_villager(self, rows, t, consider_housing):
+        # vectorized clever_assign_new_villager: the resource with the largest needed score gets the new villager
+        needed = self.resource_needed[rows]
+        labor = self.labor_division[rows]
+        shortage = needed - self.resources[rows]
+        score = np.where(labor != 0, np.trunc(shortage / np.maximum(labor, 1)), shortage)
+        score[needed == 0] = 0
+        most_needed = score.argmax(axis=1)
+
+        if consider_housing: # housing is the first consideration when population is near its max
+            population = labor.sum(axis=1)
+            build_house = (self.num_accommodation[rows] - population == 2) & (population >= 8)
+            builders = rows[build_house]
+            self.resources[builders, WOOD] -= self.rules.wood_cost_per_house
+            self.houses[builders, (t + self.house_time) % self.houses.shape[1]] += 1
+            rows, most_needed = rows[~build_house], most_needed[~build_house]
+
+        self.labor_division[rows, most_needed] += 1
+        if consider_housing: # increase demand for wood, as in calc_wood_overhead
+            self.resource_needed[rows, WOOD] = (self.resource_goal[rows, WOOD]
+                                                + self.labor_division[rows, FOOD] * self.rules.wood_cost_per_farm
+                                                + self.rules.wood_for_other_buildings)
+        for resource in range(4):
+            self.new_gatherers.append((rows[most_needed == resource], resource, t, 1))
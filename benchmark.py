@@ -0,0 +1,275 @@
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from aoe_sim import AoeSimulator
+from multi_sim import MultiSimulator
+from result_store import ResultStore
+from sweep import run_sweep, SWEEP_CACHE
+from villager import Farmer, Lumberjack, GoldMiner, StoneMiner
+
+# benchmark of the simulation loops, run: python benchmark.py --output bench.json [--compare old_bench.json]
+# every case reports its best wall time of a few repeats, events/second, peak memory (tracemalloc, measured in a
+# separate run so that it does not slow down the timing) and, for the simulations, time per event type
+
+MAIN_GOAL = {'food': 5000, 'wood': 4000, 'gold': 4000, 'stone': 1500} # the goal of __main__ in aoe_sim.py
+ASSIGNMENT_EVENTS = ('villager_trained', 'house_completed')
+HERE = os.path.dirname(os.path.abspath(__file__)) # the subprocesses run here, wherever the benchmark is started from
+
+
+class EventTimer:
+    # a trace callback that adds up the time spent on each type of event (the time since the previous event)
+    def __init__(self):
+        self.seconds = {}
+        self.counts = {}
+        self.last = time.perf_counter()
+
+    def __call__(self, sim, event_time, event_desc, amount):
+        now = time.perf_counter()
+        self.seconds[event_desc] = self.seconds.get(event_desc, 0) + now - self.last
+        self.counts[event_desc] = self.counts.get(event_desc, 0) + 1
+        self.last = now
+
+    def summary(self):
+        per_event_type = {desc: {'count': self.counts[desc], 'seconds': self.seconds[desc]} for desc in self.seconds}
+        assignment = sum(self.seconds.get(desc, 0) for desc in ASSIGNMENT_EVENTS)
+        gather = sum(self.seconds.get(desc, 0) for desc in ('food', 'wood', 'gold', 'stone'))
+        return {'per_event_type': per_event_type, 'assignment_seconds': assignment, 'gather_seconds': gather}
+
+
+def mixed_villagers(num_villager):
+    # villagers of every type, starting 25 sec. after each other like a town center would train them
+    villager_types = [Farmer, Lumberjack, GoldMiner, StoneMiner]
+    return [villager_types[i % 4](25 * i) for i in range(num_villager)]
+
+
+def scaled_goal(running_time):
+    # the __main__ goal for the default running time, scaled up for longer horizons
+    scale = max(1, running_time // 10000)
+    return {key: value * scale for key, value in MAIN_GOAL.items()}
+
+
+def measure(run, repeat):
+    # run() does one measured piece of work and returns the simulator it used (or None)
+    best, sim = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            sim = run()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        run()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    result = {'seconds': best, 'peak_memory_kb': peak_memory / 1024}
+    if sim is not None:
+        result.update(sim.stats())
+        result['events_per_second'] = sim.stats()['events_processed'] / best if best else None
+    return result
+
+
+def options(scheduler, wake_on_food=False):
+    # the simulator options of a case, left out of the result when they are the defaults, so the case names of
+    # earlier runs stay the same
+    result = {} if scheduler is None else {'scheduler': scheduler}
+    if wake_on_food:
+        result['wake_on_food'] = True
+    return result
+
+
+def bench_event_heap(num_villager, running_time, repeat, scheduler=None):
+    villagers = mixed_villagers(num_villager)
+
+    def generate():
+        sim = AoeSimulator(running_time, scheduler=scheduler)
+        sim.event_heap = sim.generate_event_heap(villagers)
+        return None
+
+    def process():
+        sim = AoeSimulator(running_time, scheduler=scheduler)
+        sim.set_resource_goal({})
+        sim.event_heap = sim.generate_event_heap(villagers)
+        sim.process_event_pq()
+        return sim
+
+    return [dict(case='generate_event_heap', num_villager=num_villager, running_time=running_time,
+                 **options(scheduler), **measure(generate, repeat)),
+            dict(case='process_event_pq', num_villager=num_villager, running_time=running_time,
+                 **options(scheduler), **measure(process, repeat))]
+
+
+def bench_sim(kind, num_villager, running_time, repeat, scheduler=None, wake_on_food=False):
+    goal = scaled_goal(running_time)
+
+    def run(trace=None):
+        sim = AoeSimulator(running_time, scheduler=scheduler, wake_on_food=wake_on_food)
+        sim.set_resource_goal(dict(goal))
+        if kind == 'simple_sim':
+            sim.simple_sim(num_villager, trace=trace)
+        else:
+            sim.complex_sim(num_villager, verbose=False, trace=trace)
+        return sim
+
+    result = dict(case=kind, num_villager=num_villager, running_time=running_time,
+                  **options(scheduler, wake_on_food), **measure(run, repeat))
+    timer = EventTimer()
+    with contextlib.redirect_stdout(io.StringIO()):
+        run(timer)
+    result.update(timer.summary())
+    return result
+
+
+def bench_sweep(max_workers, repeat):
+    # the sweep behind draw_graph(MAIN_GOAL, (10, 100)), without the plotting
+    def run():
+        SWEEP_CACHE.chains.clear() # every repeat starts cold
+        run_sweep([MAIN_GOAL], range(10, 101), max_workers=max_workers)
+        return None
+
+    return dict(case='draw_graph_sweep', max_workers=max_workers, **measure(run, repeat))
+
+
+def bench_stored_sweep(repeat):
+    # the same sweep again when all its points are already in a result store
+    store = ResultStore(':memory:')
+    run_sweep([MAIN_GOAL], range(10, 101), store=store)
+
+    def run():
+        run_sweep([MAIN_GOAL], range(10, 101), store=store)
+        return None
+
+    return dict(case='stored_sweep', **measure(run, repeat))
+
+
+def bench_multi(num_villager, num_players, running_time, repeat):
+    # num_players players with one town center per 100 villagers, time per event should not grow with population
+    goal = {key: value * max(1, num_villager // 100) for key, value in scaled_goal(running_time).items()}
+
+    def run():
+        multi = MultiSimulator(running_time)
+        for _ in range(num_players):
+            multi.add_player(goal, num_villager, num_town_centers=max(1, num_villager // 100))
+        multi.run()
+        return multi
+
+    result = dict(case='multi_sim', num_villager=num_villager, running_time=running_time, **measure(run, repeat))
+    result['seconds_per_event'] = result['seconds'] / result['events_processed']
+    return result
+
+
+def bench_monte_carlo(num_replicates, max_workers, repeat):
+    # replicates of complex_sim(30) with random gather trips, see monte_carlo.py (requires NumPy, so imported here)
+    from monte_carlo import monte_carlo
+
+    def run():
+        monte_carlo(MAIN_GOAL, 30, num_replicates, max_workers=max_workers)
+        return None
+
+    result = dict(case='monte_carlo', num_villager=30, max_workers=max_workers, **measure(run, repeat))
+    result['replicates_per_second'] = num_replicates / result['seconds']
+    return result
+
+
+def bench_import(module, repeat):
+    # cold start of a fresh interpreter importing the module, as paid by every short-lived worker process
+    # (the start of a bare interpreter is measured too, so the cost of the import itself is the difference)
+    def start(code):
+        best = None
+        for _ in range(repeat):
+            begin = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], check=True, cwd=HERE)
+            seconds = time.perf_counter() - begin
+            best = seconds if best is None else min(best, seconds)
+        return best
+
+    seconds, bare = start('import ' + module), start('pass')
+    code = 'import tracemalloc; tracemalloc.start(); import %s; print(tracemalloc.get_traced_memory()[1])' % module
+    peak_memory = int(subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True,
+                                     cwd=HERE).stdout)
+    return {'case': 'import', 'module': module, 'seconds': seconds, 'import_seconds': seconds - bare,
+            'peak_memory_kb': peak_memory / 1024}
+
+
+def run_benchmarks(quick=False, repeat=3):
+    villager_counts = [10, 100] if quick else [10, 100, 1000]
+    running_times = [10000] if quick else [10000, 100000]
+    sim_counts = [10, 50] if quick else [10, 50, 100, 200]
+    results = [bench_import(module, repeat) for module in ('aoe_sim', 'sweep')]
+    for running_time in running_times:
+        for num_villager in villager_counts:
+            results.extend(bench_event_heap(num_villager, running_time, repeat))
+        for kind in ('simple_sim', 'complex_sim'):
+            for num_villager in sim_counts:
+                results.append(bench_sim(kind, num_villager, running_time, repeat))
+        for num_villager in villager_counts:
+            results.append(bench_multi(num_villager, 4, running_time, repeat))
+    # heap against calendar queue (and polling against waking on food) up to running_time 10^6
+    for running_time in running_times + ([] if quick else [1000000]):
+        for scheduler in ('heap', 'calendar'):
+            for num_villager in ([100] if quick or running_time > 100000 else [100, 1000]):
+                results.extend(bench_event_heap(num_villager, running_time, repeat, scheduler))
+            for wake_on_food in (False, True):
+                results.append(bench_sim('complex_sim', 200, running_time, repeat, scheduler, wake_on_food))
+    results.append(bench_sweep(1, repeat))
+    results.append(bench_stored_sweep(repeat))
+    with_numpy = importlib.util.find_spec('numpy') is not None # the monte_carlo cases are skipped without it
+    if with_numpy:
+        results.append(bench_monte_carlo(1000 if quick else 10000, 1, repeat))
+    if not quick:
+        results.append(bench_sweep(None, repeat))
+        if with_numpy:
+            results.append(bench_monte_carlo(10000, None, repeat))
+    return results
+
+
+def case_name(result):
+    keys = ('case', 'module', 'num_villager', 'running_time', 'max_workers', 'scheduler', 'wake_on_food')
+    return ' '.join('%s=%s' % (key, result[key]) for key in keys if key in result)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=HERE).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the AoE simulation loops.')
+    parser.add_argument('--output', help='save the results as JSON to this file')
+    parser.add_argument('--compare', help='a JSON file of an earlier run, print the speed ratio of each case')
+    parser.add_argument('--quick', action='store_true', help='only the small cases')
+    parser.add_argument('--repeat', type=int, default=3, help='repeats per case, the best time is kept')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.quick, args.repeat)
+    report = {'commit': git_commit(), 'python': platform.python_version(), 'results': results}
+    earlier = {}
+    if args.compare:
+        with open(args.compare) as file:
+            earlier = {case_name(result): result for result in json.load(file)['results']}
+
+    for result in results:
+        line = '%-90s %9.4f s %10.0f KB' % (case_name(result), result['seconds'], result['peak_memory_kb'])
+        if result.get('events_per_second'):
+            line += ' %12.0f events/s' % result['events_per_second']
+        if case_name(result) in earlier:
+            line += '  x%.2f' % (earlier[case_name(result)]['seconds'] / result['seconds']) # > 1 means faster now
+        print(line)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=1)
+
+
+if __name__ == '__main__':
+    main()
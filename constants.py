@@ -1,12 +1,2 @@
 DEFAULT_RUNNING_TIME = 10000  # all time is based on seconds
-INITIAL_FOOD = INITIAL_WOOD = 200  # as per game start
-INITIAL_GOLD = 100
-INITIAL_STONE = 0
-INITIAL_ACCOMMO = ACCOMMO_PER_HOUSE = 5  # TownCenter can provide 5 accommodation at beginning
-
-VILLAGE_TRAINING_TIME = 25  # it takes 25 seconds to train a villager
-TRY_TRAIN_VILLAGER_INTERVAL = 10  # if not enough food to train villager now, try again after 10 seconds
-FOOD_COST_PER_VILLAGER = 50
-WOOD_COST_PER_HOUSE = 25
-WOOD_COST_PER_FARM = 60
-WOOD_COST_PER_ONE_UNIT_FOOD = 0.25
\ No newline at end of file
+# the rules of the game (costs, timings, gather rates) are data in default_rules.json, see ruleset.py
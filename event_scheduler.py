@@ -0,0 +1,233 @@
+from bisect import insort
+from heapq import heappush, heappop, heapify
+from itertools import count
+
+
+# when several events are scheduled at the same time, they are processed in this order
+# (it is the alphabetical order of the descriptions, which is what the simulator has always used)
+EVENT_ORDER = ('food', 'gold', 'house_completed', 'stone', 'try_train_villager', 'villager_trained', 'wood')
+EVENT_RANK = {event_desc: rank for rank, event_desc in enumerate(EVENT_ORDER)}
+
+
+class EventScheduler:
+    # a plain heapq-based event queue for the single-threaded simulator (no locks like queue.PriorityQueue)
+    # entry form: (scheduled_time, rank, seq, event_description, amount, interval, last_time)
+    # rank and seq break ties between equal-time events, so the description strings are never compared
+    # a periodic event (e.g. a villager gathering every work_interval) occupies only one entry, when it is
+    # popped its next occurrence is pushed back, so future events are generated lazily
+    """
+    >>> scheduler = EventScheduler()
+    >>> scheduler.put_periodic(32, 'food', 10, 32, 96)
+    >>> scheduler.put((40, 'try_train_villager', 0))
+    >>> scheduler.put((32, 'villager_trained', 0))
+    >>> len(scheduler)
+    3
+    >>> [scheduler.get() for _ in range(5)]
+    [(32, 'food', 10), (32, 'villager_trained', 0), (40, 'try_train_villager', 0), (64, 'food', 10), (96, 'food', 10)]
+    >>> scheduler.empty()
+    True
+    >>> scheduler.num_events, scheduler.max_size
+    (5, 3)
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.seq = count() # increasing sequence number, the last tie-breaker
+        self.num_events = 0 # lightweight counters for profiling: events popped so far,
+        self.max_size = 0 # and the largest number of pending entries (high-water mark)
+
+    def __len__(self):
+        return len(self.heap)
+
+    def empty(self):
+        return not self.heap
+
+    def pending(self):
+        # the pending entries, in no particular order
+        return self.heap
+
+    def copy(self):
+        # an independent scheduler with the same pending events, used for snapshots of a simulation
+        new_scheduler = EventScheduler()
+        new_scheduler.heap = list(self.heap)
+        new_scheduler.seq = count(next(self.seq)) # both go on numbering after every existing entry
+        new_scheduler.num_events = self.num_events
+        new_scheduler.max_size = self.max_size
+        return new_scheduler
+
+    def make_entry(self, event_time, event_desc, amount, interval=0, last_time=0):
+        return event_time, EVENT_RANK[event_desc], next(self.seq), event_desc, amount, interval, last_time
+
+    def put(self, event):
+        # event form: (time, event_description, amount)
+        heappush(self.heap, self.make_entry(*event))
+        if len(self.heap) > self.max_size:
+            self.max_size = len(self.heap)
+
+    def put_periodic(self, first_time, event_desc, amount, interval, last_time):
+        # schedule event at first_time, first_time + interval, ... up to (and including) last_time
+        if first_time <= last_time:
+            heappush(self.heap, self.make_entry(first_time, event_desc, amount, interval, last_time))
+            if len(self.heap) > self.max_size:
+                self.max_size = len(self.heap)
+
+    def put_many(self, events):
+        # batch version of put/put_periodic, each event is either (time, description, amount)
+        # or (first_time, description, amount, interval, last_time) for a periodic one
+        entries = [self.make_entry(*event) for event in events if len(event) == 3 or event[0] <= event[4]]
+        if len(entries) > len(self.heap): # merging a big batch, one heapify is cheaper than pushing one by one
+            self.heap.extend(entries)
+            heapify(self.heap)
+        else:
+            for entry in entries:
+                heappush(self.heap, entry)
+        if len(self.heap) > self.max_size:
+            self.max_size = len(self.heap)
+
+    def get(self):
+        # pop the earliest event, return it in form of (time, event_description, amount)
+        event_time, rank, _, event_desc, amount, interval, last_time = heappop(self.heap)
+        self.num_events += 1
+        if interval and event_time + interval <= last_time: # push back the next occurrence of a periodic event
+            heappush(self.heap, (event_time + interval, rank, next(self.seq), event_desc, amount, interval, last_time))
+        return event_time, event_desc, amount
+
+
+class CalendarScheduler:
+    # a calendar queue for integer event times, with the same interface and the same order of events as EventScheduler
+    # (entries are the same tuples, and seq numbers are given in the same order, so the results are identical)
+    # the next `window` seconds are a ring of buckets, one per second, so inserting an event is an append and
+    # popping one takes the next entry of the current bucket: both O(1) amortized whatever the number of events,
+    # a bucket is sorted (by rank, seq) once when its second comes, later insertions into it keep it sorted
+    # events beyond the window wait in a small heap and move into the ring when the window reaches them
+    """
+    >>> scheduler = CalendarScheduler(window=16)
+    >>> scheduler.put_periodic(32, 'food', 10, 32, 96)
+    >>> scheduler.put((40, 'try_train_villager', 0))
+    >>> scheduler.put((32, 'villager_trained', 0))
+    >>> len(scheduler)
+    3
+    >>> [scheduler.get() for _ in range(5)]
+    [(32, 'food', 10), (32, 'villager_trained', 0), (40, 'try_train_villager', 0), (64, 'food', 10), (96, 'food', 10)]
+    >>> scheduler.empty()
+    True
+    >>> scheduler.num_events, scheduler.max_size
+    (5, 3)
+    """
+
+    def __init__(self, window=64):
+        self.window = window # seconds covered by the ring, longer than most intervals between events
+        self.ring = [[] for _ in range(window)] # bucket of second t is ring[t % window]
+        self.now = 0 # the second of the current bucket, no event can be scheduled before it
+        self.pos = 0 # entries of the current bucket before pos are already popped
+        self.num_ring = 0 # entries in the ring, popped ones included until their bucket is left
+        self.far = [] # heap of the entries at now + window or later
+        self.seq = count()
+        self.num_events = 0
+        self.max_size = 0
+
+    def __len__(self):
+        return self.num_ring - self.pos + len(self.far)
+
+    def empty(self):
+        return self.num_ring == self.pos and not self.far
+
+    def pending(self):
+        return self.ring[self.now % self.window][self.pos:] + \
+            [entry for bucket in self.ring[self.now % self.window + 1:] + self.ring[:self.now % self.window]
+             for entry in bucket] + self.far
+
+    def copy(self):
+        new_scheduler = CalendarScheduler(self.window)
+        new_scheduler.ring = [list(bucket) for bucket in self.ring]
+        new_scheduler.now, new_scheduler.pos, new_scheduler.num_ring = self.now, self.pos, self.num_ring
+        new_scheduler.far = list(self.far)
+        new_scheduler.seq = count(next(self.seq))
+        new_scheduler.num_events = self.num_events
+        new_scheduler.max_size = self.max_size
+        return new_scheduler
+
+    def make_entry(self, event_time, event_desc, amount, interval=0, last_time=0):
+        return event_time, EVENT_RANK[event_desc], next(self.seq), event_desc, amount, interval, last_time
+
+    def insert(self, entry):
+        event_time = entry[0]
+        if event_time < self.now:
+            raise ValueError('event at %d scheduled after time %d' % (event_time, self.now))
+        if event_time == self.now: # the current bucket is sorted, keep it so
+            insort(self.ring[event_time % self.window], entry, self.pos)
+            self.num_ring += 1
+        elif event_time < self.now + self.window:
+            self.ring[event_time % self.window].append(entry)
+            self.num_ring += 1
+        else:
+            heappush(self.far, entry)
+        size = self.num_ring - self.pos + len(self.far)
+        if size > self.max_size:
+            self.max_size = size
+
+    def put(self, event):
+        self.insert(self.make_entry(*event))
+
+    def put_periodic(self, first_time, event_desc, amount, interval, last_time):
+        if first_time <= last_time:
+            self.insert(self.make_entry(first_time, event_desc, amount, interval, last_time))
+
+    def put_many(self, events):
+        for event in events:
+            if len(event) == 3 or event[0] <= event[4]:
+                self.insert(self.make_entry(*event))
+
+    def advance(self):
+        # move on to the next second with events, the current bucket is used up
+        bucket = self.ring[self.now % self.window]
+        self.num_ring -= len(bucket)
+        bucket.clear()
+        self.pos = 0
+        if not self.num_ring: # nothing left in the ring, jump to the first far event
+            self.now = self.far[0][0]
+        else:
+            self.now += 1
+        while True:
+            limit = self.now + self.window
+            far = self.far
+            while far and far[0][0] < limit: # the window now reaches these events
+                entry = heappop(far)
+                self.ring[entry[0] % self.window].append(entry)
+                self.num_ring += 1
+            bucket = self.ring[self.now % self.window]
+            if bucket:
+                if len(bucket) > 1:
+                    bucket.sort()
+                return
+            self.now += 1
+
+    def get(self):
+        bucket = self.ring[self.now % self.window]
+        if self.pos == len(bucket):
+            self.advance()
+            bucket = self.ring[self.now % self.window]
+        event_time, rank, _, event_desc, amount, interval, last_time = bucket[self.pos]
+        self.pos += 1
+        self.num_events += 1
+        if interval and event_time + interval <= last_time: # the next occurrence is later than now, see insert
+            next_time = event_time + interval
+            entry = (next_time, rank, next(self.seq), event_desc, amount, interval, last_time)
+            if next_time < event_time + self.window:
+                self.ring[next_time % self.window].append(entry)
+                self.num_ring += 1
+            else:
+                heappush(self.far, entry)
+        return event_time, event_desc, amount
+
+
+SCHEDULERS = {'heap': EventScheduler, 'calendar': CalendarScheduler}
+
+
+def make_scheduler(scheduler=None):
+    """
+    :param scheduler: None (the heap), 'heap' or 'calendar', see SCHEDULERS
+    >>> type(make_scheduler()).__name__, type(make_scheduler('calendar')).__name__
+    ('EventScheduler', 'CalendarScheduler')
+    """
+    return SCHEDULERS['heap' if scheduler is None else scheduler]()
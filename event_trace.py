@@ -0,0 +1,135 @@
+import csv
+import json
+import struct
+from array import array
+from event_scheduler import EVENT_ORDER, EVENT_RANK
+
+
+# a trace is a callback given to simple_sim/complex_sim, it is called as trace(sim, time, event_description, amount)
+# after each event is processed, the writers below turn the state of the simulator into records
+# and write them in chunks of chunk_size records, so that only one chunk is kept in memory
+TRACE_FIELDS = ('time', 'event', 'amount', 'food', 'wood', 'gold', 'stone', 'population', 'accommodation')
+
+
+class TraceWriter:
+    # every: keep one event out of every n events
+    # interval: keep at most one event per interval seconds of game time (0 keeps all)
+    mode = 'w'
+    newline = None
+
+    def __init__(self, path, chunk_size=4096, every=1, interval=0):
+        self.file = open(path, self.mode, newline=self.newline)
+        self.chunk_size = chunk_size
+        self.every = every
+        self.interval = interval
+        self.num_events = 0
+        self.next_time = 0
+        self.chunk = []
+        self.write_header()
+
+    def __call__(self, sim, event_time, event_desc, amount):
+        self.num_events += 1
+        if self.every > 1 and (self.num_events - 1) % self.every: # decimation, the record is not even built
+            return
+        if self.interval:
+            if event_time < self.next_time:
+                return
+            self.next_time = event_time + self.interval
+        resources = sim.resources
+        self.chunk.append((event_time, event_desc, amount, resources['food'], resources['wood'], resources['gold'],
+                           resources['stone'], sum(sim.labor_division.values()), getattr(sim, 'num_accommodation', 0)))
+        if len(self.chunk) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.chunk:
+            self.write_chunk(self.chunk)
+            self.chunk = []
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write_header(self):
+        pass
+
+    def write_chunk(self, records):
+        raise NotImplementedError
+
+
+class CsvTraceWriter(TraceWriter):
+    newline = '' # let the csv module handle line endings
+
+    def write_header(self):
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(TRACE_FIELDS)
+
+    def write_chunk(self, records):
+        self.writer.writerows(records)
+
+
+class NdjsonTraceWriter(TraceWriter):
+    # one json object per line
+
+    def write_chunk(self, records):
+        self.file.write(''.join(json.dumps(dict(zip(TRACE_FIELDS, record))) + '\n' for record in records))
+
+
+# columnar binary format: MAGIC, then chunks of (number of records as uint32, then each column as a packed array)
+MAGIC = b'AOETRACE1\n'
+COLUMN_TYPES = ('q', 'B', 'd', 'd', 'd', 'd', 'd', 'i', 'i') # array typecodes of TRACE_FIELDS, event is its rank
+
+
+class BinaryTraceWriter(TraceWriter):
+    """
+    >>> import os, tempfile
+    >>> from aoe_sim import AoeSimulator
+    >>> path = os.path.join(tempfile.mkdtemp(), 'trace.bin')
+    >>> sim = AoeSimulator()
+    >>> sim.set_resource_goal({'food':1000, 'gold':800})
+    >>> with BinaryTraceWriter(path, chunk_size=100) as writer:
+    ...     sim.complex_sim(10, verbose=False, trace=writer)
+    >>> records = list(read_binary_trace(path))
+    >>> len(records), writer.num_events
+    (296, 296)
+    >>> records[-1]
+    (960, 'food', 10.0, 1000.0, 535.0, 1140.0, 0.0, 10, 15)
+    """
+    mode = 'wb'
+
+    def write_header(self):
+        self.file.write(MAGIC)
+
+    def write_chunk(self, records):
+        self.file.write(struct.pack('<I', len(records)))
+        for i, typecode in enumerate(COLUMN_TYPES):
+            if i == 1:
+                column = array(typecode, [EVENT_RANK[record[1]] for record in records])
+            else:
+                column = array(typecode, [record[i] for record in records])
+            self.file.write(column.tobytes())
+
+
+def read_binary_trace(path):
+    # read a file of BinaryTraceWriter chunk by chunk, yield records in the form of TRACE_FIELDS
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not a binary trace file' % path)
+        while True:
+            size = file.read(4)
+            if not size:
+                return
+            num_records = struct.unpack('<I', size)[0]
+            columns = []
+            for typecode in COLUMN_TYPES:
+                column = array(typecode)
+                column.frombytes(file.read(num_records * column.itemsize))
+                columns.append(column)
+            columns[1] = [EVENT_ORDER[rank] for rank in columns[1]]
+            yield from zip(*columns)
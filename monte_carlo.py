@@ -0,0 +1,216 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+import numpy as np
+from batch_sim import BatchSimulator, RESOURCE_TYPES
+from constants import *
+
+
+# Monte Carlo version of complex_sim: the time of each gather trip is random, so the finish time is a distribution
+# a replicate is one run of the game, replicates are simulated side by side by MonteCarloSimulator (requires NumPy)
+
+# replicates of one block share a random generator, a process simulates all its blocks side by side in one run,
+# so small blocks cost little more than large ones, and 10000 replicates make 20 blocks to spread over processes
+REPLICATES_PER_BLOCK = 500
+WALK_SPEED = 0.8 # tiles per second, villager speed in AoE II
+MAX_TRIP = 3600 # seconds, the longest gather trip
+
+
+def sample(rng, spec, size):
+    """
+    Draw size values from a distribution given as a tuple:
+    ('fixed', value), ('uniform', low, high), ('normal', mean, sd) or ('exponential', mean)
+    >>> sample(np.random.default_rng(0), ('fixed', 3), 2).tolist()
+    [3.0, 3.0]
+    """
+    kind, *params = spec
+    if kind == 'fixed':
+        return np.full(size, float(params[0]))
+    if kind == 'uniform':
+        return rng.uniform(params[0], params[1], size)
+    if kind == 'normal':
+        return rng.normal(params[0], params[1], size)
+    if kind == 'exponential':
+        return rng.exponential(params[0], size)
+    raise ValueError('unknown distribution %r' % (kind,))
+
+
+class StochasticModel:
+    # trip_time: the time of a gather trip, as a factor of the work interval of the resource (32 s for food etc.)
+    # walk_distance: tiles from the resource to the drop-off point, drawn for each villager and each new patch,
+    # every trip walks there and back at WALK_SPEED
+    # patch_size: {resource: distribution} of the amount in a farm, tree, mine, when it is exhausted the villager
+    # moves to a new patch (with a new walk distance), resources left out never run out
+    def __init__(self, trip_time=('normal', 1.0, 0.1), walk_distance=('uniform', 0.0, 3.0), patch_size=None):
+        self.trip_time = trip_time
+        self.walk_distance = walk_distance
+        if patch_size is None:
+            patch_size = {'food': ('fixed', 175), 'wood': ('uniform', 75, 125), 'gold': ('fixed', 800),
+                          'stone': ('fixed', 350)}
+        self.patch_size = [patch_size.get(key) for key in RESOURCE_TYPES]
+
+
+# no randomness at all, the same as complex_sim
+DETERMINISTIC = StochasticModel(trip_time=('fixed', 1), walk_distance=('fixed', 0), patch_size={})
+
+
+class MonteCarloSimulator(BatchSimulator):
+    """
+    BatchSimulator where every villager is tracked on its own: instead of the periodic phase tables, gather trips are
+    kept in a calendar {time: [villager ids]} per resource, and each trip draws its own time from the model
+    with block_size, the replicates are split into blocks of block_size, and seed is a list of seeds, one per block:
+    each block draws from its own generator in the order it would alone, so its results are the same as if it was run
+    on its own
+    >>> goal = {'food':1000, 'gold':800}
+    >>> MonteCarloSimulator(DETERMINISTIC).run([goal] * 3, [10, 15, 20]).tolist() # same as complex_sim
+    [960, 800, 769]
+    >>> finish_times = MonteCarloSimulator(seed=1).run([goal] * 1000, 10) # walking makes it slower on average
+    >>> int(finish_times.min()), int(finish_times.max())
+    (985, 1136)
+    >>> together = MonteCarloSimulator(seed=[1, 2], block_size=20).run([goal] * 40, 10)
+    >>> bool((together[20:] == MonteCarloSimulator(seed=2).run([goal] * 20, 10)).all())
+    True
+    """
+
+    def __init__(self, model=None, running_time=DEFAULT_RUNNING_TIME, seed=None, rules=None, block_size=None):
+        super().__init__(running_time, rules)
+        self.model = StochasticModel() if model is None else model
+        self.block_size = block_size
+        self.rngs = [np.random.default_rng(seed)] if block_size is None else [np.random.default_rng(s) for s in seed]
+
+    def run(self, resource_goals, num_villagers, mode='complex'):
+        self.calendar = [{} for _ in RESOURCE_TYPES]
+        self.num_villagers = 0 # villagers are numbered by the order they start gathering
+        self.villager_row = np.empty(1024, dtype=int) # the replicate of each villager
+        self.walk_time = np.empty(1024) # seconds of walking per trip
+        self.patch_left = np.empty(1024) # resource left in the patch the villager gathers from
+        return super().run(resource_goals, num_villagers, mode)
+
+    def add_new_gatherers(self):
+        for rows, resource, t0, amount in self.new_gatherers:
+            if not rows.size:
+                continue
+            rows = np.repeat(rows, amount)
+            ids = np.arange(self.num_villagers, self.num_villagers + rows.size)
+            self.num_villagers += rows.size
+            if self.num_villagers > self.villager_row.size: # grow the arrays, doubling their size
+                size = max(2 * self.villager_row.size, self.num_villagers)
+                for name in ('villager_row', 'walk_time', 'patch_left'):
+                    array = getattr(self, name)
+                    setattr(self, name, np.concatenate([array, np.empty(size - array.size, dtype=array.dtype)]))
+            self.villager_row[ids] = rows
+            self.new_patch(ids, resource)
+            self.schedule(ids, resource, t0)
+        self.new_gatherers = []
+
+    def new_patch(self, ids, resource):
+        self.walk_time[ids] = 2 * np.maximum(0, self.draw(self.model.walk_distance, ids)) / WALK_SPEED
+        if self.model.patch_size[resource] is not None:
+            self.patch_left[ids] = self.draw(self.model.patch_size[resource], ids)
+
+    def draw(self, spec, ids):
+        # a value for each villager of ids, the villagers of each block in the order of ids from the block's generator
+        if len(self.rngs) == 1 or spec[0] == 'fixed': # a fixed value draws nothing
+            return sample(self.rngs[0], spec, ids.size)
+        blocks = self.villager_row[ids] // self.block_size
+        order = np.argsort(blocks, kind='stable')
+        counts = np.bincount(blocks, minlength=len(self.rngs))
+        values = np.empty(ids.size)
+        start = 0
+        for block in np.flatnonzero(counts).tolist():
+            end = start + int(counts[block])
+            values[order[start:end]] = sample(self.rngs[block], spec, end - start)
+            start = end
+        return values
+
+    def schedule(self, ids, resource, t):
+        # the next gather of each villager, one second at least
+        if not ids.size:
+            return
+        trip = self.work_interval[resource] * self.draw(self.model.trip_time, ids) + self.walk_time[ids]
+        trip = np.clip(np.rint(trip), 1, MAX_TRIP).astype(np.int16) # small integers are sorted by radix sort
+        order = np.argsort(trip, kind='stable')
+        trip, ids = trip[order], ids[order]
+        bounds = np.flatnonzero(trip[1:] != trip[:-1]) + 1 # where the trip time changes
+        calendar = self.calendar[resource]
+        start = 0
+        for end in bounds.tolist() + [ids.size]:
+            calendar.setdefault(t + int(trip[start]), []).append(ids[start:end])
+            start = end
+
+    def gathering_rows(self, t, resource):
+        parts = self.calendar[resource].pop(t, None)
+        if parts is None or t + self.work_interval[resource] > self.running_time:
+            return np.empty(0, dtype=int), np.empty(0, dtype=int)
+        ids = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        ids = ids[self.active[self.villager_row[ids]]] # villagers of finished replicates stop
+        if self.model.patch_size[resource] is not None: # each gather takes max_capacity from the patch
+            self.patch_left[ids] -= self.max_capacity[resource]
+            exhausted = ids[self.patch_left[ids] <= 0]
+            if exhausted.size:
+                self.new_patch(exhausted, resource)
+        self.schedule(ids, resource, t)
+        num_gatherers = np.bincount(self.villager_row[ids], minlength=self.active.size)
+        rows = np.flatnonzero(num_gatherers)
+        return rows, num_gatherers[rows]
+
+
+def simulate_blocks(task):
+    # finish times of consecutive blocks of replicates (only the last one may be smaller than block_size) simulated
+    # side by side, a module level function so that it can be sent to worker processes
+    resource_goal, num_villager, num_replicates, model, running_time, seeds, rules, block_size = task
+    simulator = MonteCarloSimulator(model, running_time, seeds, rules, block_size)
+    return simulator.run([resource_goal] * num_replicates, num_villager)
+
+
+def summarize(finish_times, percentiles=(5, 25, 50, 75, 95)):
+    """
+    Statistics of the finish times of the replicates that met the goal (-1 for the others)
+    >>> summarize(np.array([100, 200, 300, -1]), percentiles=(50,))
+    {'num_replicates': 4, 'num_met': 3, 'mean': 200.0, 'std': 81.64965809277261, 'min': 100, 'max': 300, 'percentiles': {50: 200.0}}
+    """
+    met = finish_times[finish_times >= 0]
+    result = {'num_replicates': len(finish_times), 'num_met': len(met)}
+    if len(met):
+        result.update(mean=float(met.mean()), std=float(met.std()), min=int(met.min()), max=int(met.max()),
+                      percentiles=dict(zip(percentiles, np.percentile(met, percentiles).tolist())))
+    else:
+        result.update(mean=None, std=None, min=None, max=None, percentiles={p: None for p in percentiles})
+    return result
+
+
+def monte_carlo(resource_goal, num_villager, num_replicates=1000, model=None, seed=0, max_workers=None,
+                running_time=DEFAULT_RUNNING_TIME, percentiles=(5, 25, 50, 75, 95), rules=None,
+                block_size=REPLICATES_PER_BLOCK):
+    """
+    Run num_replicates of complex_sim with random gather trips (see StochasticModel), return the distribution of
+    their finish time (see summarize), the finish times themselves are in result['finish_times']
+    the replicates are split into blocks of block_size, each with its own seed spawned from seed, so the result only
+    depends on seed and block_size, not on the number of worker processes, each process simulates its share of
+    the blocks side by side, rules is a Ruleset (see ruleset.py)
+    >>> result = monte_carlo({'food':1000, 'gold':800}, 10, num_replicates=3000, max_workers=1)
+    >>> result['num_met'], round(result['mean']), result['percentiles'][50]
+    (3000, 1059, 1059.0)
+    >>> again = monte_carlo({'food':1000, 'gold':800}, 10, num_replicates=3000, max_workers=2)
+    >>> bool((again['finish_times'] == result['finish_times']).all())
+    True
+    >>> monte_carlo({'food':1000, 'gold':800}, 10, num_replicates=10, model=DETERMINISTIC)['percentiles'][95]
+    960.0
+    """
+    num_blocks = -(-num_replicates // block_size)
+    seeds = np.random.SeedSequence(seed).spawn(num_blocks)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = min(max_workers, num_blocks)
+    # one task of consecutive blocks per process
+    bounds = [num_blocks * i // max_workers for i in range(max_workers + 1)]
+    tasks = [(resource_goal, num_villager, min(num_replicates, end * block_size) - start * block_size, model,
+              running_time, seeds[start:end], rules, block_size) for start, end in zip(bounds, bounds[1:])]
+    if max_workers <= 1:
+        parts = [simulate_blocks(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            parts = list(executor.map(simulate_blocks, tasks))
+    finish_times = np.concatenate(parts)
+    result = summarize(finish_times, percentiles)
+    result['finish_times'] = finish_times
+    return result
@@ -0,0 +1,157 @@
+from aoe_sim import AoeSimulator
+from event_scheduler import make_scheduler
+from ruleset import DEFAULT_RULES
+from constants import *
+
+
+class Player(AoeSimulator):
+    # the state of one player: resources shared by all his/her town centers, labor division, houses and goal
+    # it reuses the bookkeeping of AoeSimulator (goal counter, allocation policy, housing rule), while the events
+    # of all players are processed by MultiSimulator
+    def __init__(self, player_id, resource_goal, num_villager, num_town_centers=1, policy=None,
+                 running_time=DEFAULT_RUNNING_TIME, rules=None):
+        super().__init__(running_time, policy, rules)
+        self.player_id = player_id
+        self.set_resource_goal(dict(resource_goal))
+        self.num_villager = num_villager # total number of villagers planned to train, over all town centers
+        self.num_town_centers = num_town_centers
+        self.num_accommodation = self.rules.initial_accommodation * num_town_centers # 5 people per town center
+        self.resources['wood'] -= self.rules.wood_cost_per_house # cost for build house at the beginning
+        self.labor_division = {'food': 3, 'wood': 0, 'gold': 0, 'stone': 0}
+        self.resource_needed = dict(self.resource_goal)
+        self.num_training = 0 # villagers being trained right now
+        # villagers gathering the same resource with the same phase (init_time % work_interval) gather at the same
+        # time, so they share one periodic event: (resource, phase) -> [count, count joining after next gather,
+        # time of next gather], so the event heap stays small however many villagers there are
+        self.gather_groups = {}
+        self.finish_time = None
+        self.count_goals_remaining()
+
+    def need_house(self):
+        # several town centers may train villagers at the same time, so population can jump over the exact
+        # "2 places left" of the single town center rule
+        cur_population = sum(self.labor_division.values())
+        return self.num_accommodation - cur_population <= 2 and cur_population >= 8
+
+
+class MultiSimulator:
+    """
+    Several players, each with one or more town centers, share one event scheduler
+    a player works like complex_sim, each town center trains villagers on its own (try_train_villager ->
+    villager_trained) until the player reaches his/her num_villager, and all of them use the player's resources
+    the event amount carries the player (and the town center or the gather group) the event belongs to
+    all players play by the same rules (a Ruleset, see ruleset.py), scheduler is 'heap' or 'calendar' (event_scheduler.py)
+    >>> multi = MultiSimulator()
+    >>> player = multi.add_player({'food':1000, 'gold':800}, 10)
+    >>> _ = multi.add_player({'food':1000, 'gold':800}, 20, num_town_centers=2)
+    >>> multi.run()
+    [960, 736]
+    >>> player.resources, player.labor_division
+    ({'food': 1000, 'wood': 535.0, 'gold': 1140, 'stone': 0}, {'food': 5, 'wood': 2, 'gold': 3, 'stone': 0})
+    """
+
+    def __init__(self, running_time=DEFAULT_RUNNING_TIME, rules=None, scheduler=None):
+        self.running_time = running_time
+        self.rules = DEFAULT_RULES if rules is None else rules
+        self.event_heap = make_scheduler(scheduler)
+        self.players = []
+
+    def add_player(self, resource_goal, num_villager, num_town_centers=1, policy=None):
+        player = Player(len(self.players), resource_goal, num_villager, num_town_centers, policy, self.running_time,
+                        self.rules)
+        self.players.append(player)
+        # each game start with 3 villagers, two farmers and one building a house, and every town center starts training
+        self.add_gatherer(player, 'food', 0)
+        self.add_gatherer(player, 'food', 0)
+        self.event_heap.put((self.rules.build_time['house'], 'house_completed', (player, None)))
+        for town_center in range(num_town_centers):
+            self.event_heap.put((0, 'try_train_villager', (player, town_center)))
+        return player
+
+    def run(self):
+        # main event loop, return the finish time of each player (None if the goal is not met)
+        rules = self.rules
+        num_playing = sum(1 for player in self.players if player.finish_time is None)
+        while num_playing and not self.event_heap.empty():
+            event_time, event_desc, event_amount = self.event_heap.get()
+            player, detail = event_amount
+            if event_desc in rules.work_interval: # gathering, detail is the gather group
+                if self.gather(player, event_time, event_desc, detail):
+                    num_playing -= 1
+            elif player.finish_time is not None: # this player is done, nothing else to do
+                continue
+            elif event_desc == 'try_train_villager': # detail is the town center
+                if player.resources['food'] >= rules.food_cost_per_villager:
+                    player.change_resource('food', -rules.food_cost_per_villager) # deduct 50 food to start training
+                    player.num_training += 1
+                    self.event_heap.put((event_time + rules.villager_training_time, 'villager_trained', event_amount))
+                elif event_time < self.running_time: # not enough food, wait and try again (the food is final from
+                    # the end of running time on, no gathering is left)
+                    self.event_heap.put((event_time + rules.try_train_villager_interval, 'try_train_villager',
+                                         event_amount))
+            elif event_desc == 'villager_trained':
+                player.num_training -= 1
+                self.assign_new_villager(player, event_time)
+                if sum(player.labor_division.values()) + player.num_training < player.num_villager:
+                    self.event_heap.put((event_time, 'try_train_villager', event_amount)) # this town center goes on
+            elif event_desc == 'house_completed':
+                player.num_accommodation += rules.accommodation_per_house
+                self.assign_new_villager(player, event_time)
+        return [player.finish_time for player in self.players]
+
+    def assign_new_villager(self, player, cur_time):
+        # same as clever_assign_new_villager with consider_housing
+        resource = player.policy.choose(player)
+        if player.need_house(): # housing is No.1 priority
+            player.change_resource('wood', -self.rules.wood_cost_per_house)
+            self.event_heap.put((cur_time + self.rules.build_time['house'], 'house_completed', (player, None)))
+        else:
+            player.labor_division[resource] += 1
+            player.resource_needed['wood'] = player.resource_goal['wood'] + player.calc_wood_overhead()
+            self.add_gatherer(player, resource, cur_time)
+
+    def add_gatherer(self, player, resource, t0):
+        # the new villager gathers first at t0 + work_interval, with the villagers of the same phase if any
+        tau = self.rules.work_interval[resource]
+        group = player.gather_groups.get((resource, t0 % tau))
+        if group is not None and group[2] == t0: # the group gathers later in this second, join right after it
+            group[1] += 1
+        elif group is not None and group[2] == t0 + tau:
+            group[0] += 1
+        else: # a new group (or the old one has stopped at the end of running time)
+            group = [1, 0, t0 + tau]
+            player.gather_groups[(resource, t0 % tau)] = group
+            last_time = t0 + ((self.running_time - t0) // tau - 1) * tau # all events are within the running time
+            self.event_heap.put_periodic(t0 + tau, resource, (player, group), tau, last_time)
+
+    def gather(self, player, event_time, resource, group):
+        # count villagers of the group gather at once, return True if the player just reached the goal
+        # the goal is checked as if after each single gather: the gathered resource only increases (wood only
+        # decreases for food), so it is met during the batch only if it is met once the resource is enough
+        num_gatherers = group[0]
+        group[0] += group[1]
+        group[1] = 0
+        group[2] = event_time + self.rules.work_interval[resource]
+        if player.finish_time is not None:
+            return False
+        amount = self.rules.max_capacity[resource]
+        wood_per_gather = self.rules.wood_cost_per_food * amount if resource == 'food' else 0
+        first = max(1, -(-(player.resource_goal[resource] - player.resources[resource]) // amount))
+        num_events = first if first <= num_gatherers else num_gatherers
+        player.change_resource(resource, amount * num_events)
+        if wood_per_gather:
+            player.change_resource('wood', -wood_per_gather * num_events)
+        if player.goals_remaining == 0:
+            player.finish_time = event_time
+            return True
+        num_left = num_gatherers - num_events
+        if num_left:
+            player.change_resource(resource, amount * num_left)
+            if wood_per_gather:
+                player.change_resource('wood', -wood_per_gather * num_left)
+        return False
+
+    def stats(self):
+        # counters of the event loop, same as AoeSimulator.stats
+        return {'events_processed': self.event_heap.num_events, 'max_heap_size': self.event_heap.max_size,
+                'pending_events': len(self.event_heap)}
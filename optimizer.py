@@ -0,0 +1,111 @@
+from heapq import nsmallest
+from aoe_sim import AoeSimulator
+from constants import *
+
+
+class StrategyOptimizer:
+    """
+    Search the villager assignments of complex_sim for the fastest way to reach a resource goal
+    every time a new villager is to be assigned (houses are still built by the housing rule), each useful resource
+    is tried from a snapshot of the simulation. It is a beam search: at each step only the beam_width states with the
+    smallest lower bound of finish time (AoeSimulator.projected_finish_time) are kept, states whose lower bound cannot
+    beat the best solution so far are pruned, and identical states reached by different sequences (a transposition
+    table) are expanded only once.
+    the greedy assignment of clever_assign_new_villager is the first solution, so the result is never worse than it
+    >>> optimizer = StrategyOptimizer({'food':1000, 'gold':800}, 10)
+    >>> finish_time, sequence = optimizer.search()
+    >>> finish_time # complex_sim(10) takes 960 sec.
+    736
+    >>> sequence[:4]
+    [(25, 'food'), (25, 'food'), (50, 'food'), (75, 'gold')]
+    """
+
+    def __init__(self, resource_goal, num_villager, beam_width=32, running_time=DEFAULT_RUNNING_TIME, rules=None):
+        self.num_villager = num_villager
+        self.beam_width = beam_width
+        self.running_time = running_time
+        self.sim = AoeSimulator(running_time, rules=rules) # a single simulator, states are switched with snapshot/restore
+        self.sim.set_resource_goal(dict(resource_goal))
+        self.initial_resources = dict(self.sim.resources)
+        # food is needed to train villagers and wood for farms and houses, the others only if they are in the goal
+        self.choices = [key for key in self.sim.resources if key in ('food', 'wood') or self.sim.resource_goal[key] > 0]
+
+    def search(self):
+        """
+        :return: (finish_time, sequence), sequence is the list of (time, resource) of every assignment decision,
+        finish_time is None if the goal cannot be met within running_time
+        """
+        sim = self.sim
+        sim.resources = dict(self.initial_resources)
+        sim.setup_complex_sim()
+        status, event_time = sim.process_complex_events(self.num_villager, stop_at_decision=True)
+        root = (sim.snapshot(), [])
+        if status != 'decision': # goal met (or impossible) before any decision
+            return event_time, []
+
+        best_time, best_sequence = self.greedy_rollout(root)
+        seen = set()
+        beam = [root]
+        while beam:
+            candidates = []
+            for snapshot, sequence in beam:
+                for resource in self.choices:
+                    sim.restore(snapshot)
+                    decision_time = sim.pending_assignment[0]
+                    sim.assign_pending_villager(self.num_villager, resource)
+                    status, event_time = sim.process_complex_events(self.num_villager, stop_at_decision=True,
+                                                                    best_time=best_time)
+                    child_sequence = sequence + [(decision_time, resource)]
+                    if status == 'goal_met':
+                        if best_time is None or event_time < best_time:
+                            best_time, best_sequence = event_time, child_sequence
+                        continue
+                    if status != 'decision': # exhausted, infeasible or pruned on the way
+                        continue
+                    bound = sim.projected_finish_time(self.num_villager, event_time)
+                    if bound is None or (best_time is not None and bound >= best_time):
+                        continue # the goal cannot be met, or not faster than the best solution
+                    key = self.state_key()
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    candidates.append((bound, event_time, len(candidates), sim.snapshot(), child_sequence))
+            beam = [(snapshot, sequence) for _, _, _, snapshot, sequence in nsmallest(self.beam_width, candidates)]
+        return best_time, best_sequence
+
+    def greedy_rollout(self, node):
+        # follow clever_assign_new_villager from this state, return (finish_time, sequence)
+        snapshot, sequence = node
+        sim = self.sim
+        sim.restore(snapshot)
+        sequence = list(sequence)
+        status, event_time = 'decision', None
+        while status == 'decision':
+            decision_time = sim.pending_assignment[0]
+            resource = sim.most_needed_resource()
+            sim.assign_pending_villager(self.num_villager, resource)
+            sequence.append((decision_time, resource))
+            status, event_time = sim.process_complex_events(self.num_villager, stop_at_decision=True)
+        return (event_time, sequence) if status == 'goal_met' else (None, sequence)
+
+    def state_key(self):
+        # everything the future of the current simulation depends on (sequence numbers of events left out)
+        sim = self.sim
+        pending_events = tuple(sorted(entry[:2] + entry[4:] for entry in sim.event_heap.pending()))
+        return (sim.pending_assignment, sim.waiting_for_food, tuple(sim.resources.values()), tuple(sim.labor_division.values()),
+                sim.num_accommodation, pending_events)
+
+
+def find_fastest_strategy(resource_goal, villager_counts, beam_width=32, rules=None):
+    """
+    Run StrategyOptimizer for each number of villagers, return (finish_time, num_villager, sequence) of the fastest
+    >>> finish_time, num_villager, sequence = find_fastest_strategy({'food':1000, 'gold':800}, [10, 15, 20], beam_width=8)
+    >>> finish_time, num_villager
+    (608, 20)
+    """
+    best = (None, None, None)
+    for num_villager in villager_counts:
+        finish_time, sequence = StrategyOptimizer(resource_goal, num_villager, beam_width, rules=rules).search()
+        if finish_time is not None and (best[0] is None or finish_time < best[0]):
+            best = (finish_time, num_villager, sequence)
+    return best
@@ -0,0 +1,54 @@
+# plotting is optional: matplotlib is only imported when a graph is drawn, so the simulator, the sweeps and
+# their worker processes start without it (importing matplotlib.pyplot takes most of a second)
+
+
+def graph_title(resource_goal):
+    """
+    >>> graph_title({'food': 1000, 'wood': 0, 'gold': 800})
+    'The time of generating 1000 food,800 gold'
+    """
+    begin = 'The time of generating '
+    temp_list = []
+    for key in resource_goal:
+        if resource_goal[key] != 0:
+            temp_list.append(str(resource_goal[key]) + ' ' + key)
+    return begin + ','.join(temp_list)
+
+
+def compact_ranges(numbers):
+    """
+    >>> compact_ranges([5, 6, 7, 9, 11, 12])
+    '5-7,9,11-12'
+    """
+    parts = []
+    for n in numbers:
+        if parts and parts[-1][1] == n - 1:
+            parts[-1][1] = n
+        else:
+            parts.append([n, n])
+    return ','.join(str(low) if low == high else '%d-%d' % (low, high) for low, high in parts)
+
+
+def plot_finish_times(resource_goal, villager_counts, finish_times, output=None):
+    # completion time versus the number of villagers, shown in a window, or saved to the output file if given
+    # a finish time of None (goal not met) leaves a gap in the line, and the counts are listed in the title
+    villager_counts = list(villager_counts)
+    not_met = [n for n, finish_time in zip(villager_counts, finish_times) if finish_time is None]
+    finish_times = [float('nan') if finish_time is None else finish_time for finish_time in finish_times]
+    import matplotlib
+    if output is not None:
+        matplotlib.use('Agg') # no display needed to save a file
+    import matplotlib.pyplot as plt
+
+    title = graph_title(resource_goal)
+    if not_met:
+        title += '\n(not met with %s villagers)' % compact_ranges(not_met)
+    plt.title(title)
+    plt.xlabel('num_villager')
+    plt.ylabel('time_spent')
+    plt.plot(villager_counts, finish_times)
+    if output is None:
+        plt.show()
+    else:
+        plt.savefig(output)
+        plt.close()
@@ -0,0 +1,107 @@
+
+
+# allocation policies decide which resource a new villager gathers (houses are still built by the housing rule)
+# a policy only reads the state of the simulator, it keeps no state of its own, so it works with snapshot/restore
+# and the same policy object can be shared by many simulations
+
+
+class GreedyPolicy:
+    # the original rule: the resource with the largest (needed - current) / num_worker
+    name = 'greedy'
+
+    def choose(self, sim):
+        return sim.most_needed_resource()
+
+    def key(self):
+        return (self.name,)
+
+
+class RoundRobinPolicy:
+    # take turns between the resources still needed: the one with the fewest workers goes next
+    # (ties in the order of sim.resources), which is round robin without keeping a counter
+    name = 'round_robin'
+
+    def choose(self, sim):
+        best, fewest = 'food', None
+        for key in sim.resources:
+            if sim.resource_needed[key] > 0 and (fewest is None or sim.labor_division[key] < fewest):
+                best, fewest = key, sim.labor_division[key]
+        return best
+
+    def key(self):
+        return (self.name,)
+
+
+class FixedRatioPolicy:
+    # keep the labor division close to a fixed ratio, e.g. {'food': 4, 'wood': 3, 'gold': 2, 'stone': 1}
+    name = 'fixed_ratio'
+
+    def __init__(self, ratio):
+        total = sum(ratio.values())
+        self.share = {key: value / total for key, value in ratio.items()}
+
+    def choose(self, sim):
+        num_worker = sum(sim.labor_division.values()) + 1 # including the new villager
+        best, largest = 'food', None
+        for key, share in self.share.items():
+            lack = share * num_worker - sim.labor_division[key]
+            if largest is None or lack > largest:
+                best, largest = key, lack
+        return best
+
+    def key(self):
+        return (self.name, tuple(sorted(self.share.items())))
+
+
+class LookaheadPolicy:
+    # try the new villager on each resource and estimate, at the resulting gather rates, when all the needed
+    # resources would be collected, resources nobody gathers yet count first so that each of them gets a worker
+    name = 'lookahead'
+
+    def choose(self, sim):
+        best, best_estimate = 'food', None
+        for candidate in sim.resources:
+            num_unstaffed, finish = 0, 0
+            work_interval, max_capacity = sim.rules.work_interval, sim.rules.max_capacity
+            for key in sim.resources:
+                shortage = sim.resource_needed[key] - sim.resources[key]
+                if shortage <= 0:
+                    continue
+                num_worker = sim.labor_division[key] + (key == candidate)
+                if num_worker == 0:
+                    num_unstaffed += 1
+                else:
+                    finish = max(finish, shortage * work_interval[key] / (num_worker * max_capacity[key]))
+            if best_estimate is None or (num_unstaffed, finish) < best_estimate:
+                best, best_estimate = candidate, (num_unstaffed, finish)
+        return best
+
+    def key(self):
+        return (self.name,)
+
+
+# the policies that can be made from their name alone, a FixedRatioPolicy needs its ratio
+POLICIES = {'greedy': GreedyPolicy, 'round_robin': RoundRobinPolicy, 'lookahead': LookaheadPolicy}
+
+
+def make_policy(policy=None):
+    """
+    :param policy: None (greedy), a name in POLICIES, or a policy object which is returned as it is
+    >>> make_policy().name, make_policy('lookahead').name
+    ('greedy', 'lookahead')
+    >>> make_policy(FixedRatioPolicy({'food': 1, 'wood': 1})).share
+    {'food': 0.5, 'wood': 0.5}
+    >>> make_policy('fixed_ratio')
+    Traceback (most recent call last):
+    ...
+    ValueError: a fixed_ratio policy needs its ratio, use a FixedRatioPolicy(ratio) object
+    """
+    if policy is None:
+        return GreedyPolicy()
+    if isinstance(policy, str):
+        if policy == FixedRatioPolicy.name:
+            raise ValueError('a fixed_ratio policy needs its ratio, use a FixedRatioPolicy(ratio) object')
+        if policy not in POLICIES:
+            raise ValueError('unknown policy %r, the names are %s' % (policy, ', '.join(POLICIES)))
+        return POLICIES[policy]()
+    return policy
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import sqlite3
+import constants
+from aoe_sim import SIMULATOR_VERSION
+from policy import make_policy
+from ruleset import DEFAULT_RULES
+
+# persistent store of sweep results in a SQLite file, one row per (goal, villager count, policy, rules, running time)
+# a row is found by a hash of everything its result depends on, so points already computed by an earlier or
+# overlapping sweep are read back instead of simulated again, and results of other game rules or of an older
+# simulator are never mixed in (they stay in the file but do not match)
+
+RESOURCE_TYPES = ('food', 'wood', 'gold', 'stone')
+# columns without a declared type keep ints as ints and floats as floats, so rows read back equal the computed ones
+COLUMNS = (['key', 'config', 'policy', 'rules', 'num_villager', 'running_time', 'finish_time', 'status']
+           + ['goal_' + key for key in RESOURCE_TYPES] + list(RESOURCE_TYPES)
+           + ['labor_' + key for key in RESOURCE_TYPES])
+MAX_PARAMETERS = 500 # keys per "IN (...)" query, below the limit of old SQLite versions
+STORE_FORMAT = 2 # layout of the rows, part of config_hash so that rows of an older layout are never read
+
+
+def config_hash(rules=None):
+    """
+    Hash of the game rules (see ruleset.py), the simulator version and the store format, it changes whenever results
+    would change
+    >>> len(config_hash()), config_hash() == config_hash(DEFAULT_RULES.variant('fast_wood', work_interval={'wood': 20}))
+    (16, False)
+    """
+    rules = DEFAULT_RULES if rules is None else rules
+    return hashlib.sha256(json.dumps([rules.key(), SIMULATOR_VERSION, STORE_FORMAT]).encode()).hexdigest()[:16]
+
+
+def policy_column(policy=None):
+    # the policy as stored in the policy column, its key() (see policy.py) as JSON, the name is its first item
+    return json.dumps(make_policy(policy).key())
+
+
+class ResultStore:
+    """
+    :param path: the SQLite file, created if it does not exist (':memory:' for a throwaway store)
+    :param mmap_size: bytes of the file SQLite reads through a memory map instead of read() calls
+    >>> store = ResultStore(':memory:')
+    >>> key = store.make_key({'food':1000, 'gold':800}, 10)
+    >>> key == store.make_key({'gold':800, 'food':1000, 'wood':0}, 10, policy='greedy')
+    True
+    >>> row = {'goal': {'food':1000, 'wood':0, 'gold':800, 'stone':0}, 'policy': 'greedy', 'rules': 'default',
+    ...        'num_villager': 10, 'finish_time': 960, 'status': 'goal_met',
+    ...        'resources': {'food':1000, 'wood':535.0, 'gold':1140, 'stone':0},
+    ...        'labor_division': {'food':5, 'wood':2, 'gold':3, 'stone':0}}
+    >>> store.put([(key, row)])
+    >>> store.get([key, 'missing']) == {key: row}
+    True
+    >>> list(store.query({'food':1000, 'gold':800}))
+    [(10, 960)]
+    >>> from policy import FixedRatioPolicy
+    >>> half, third = FixedRatioPolicy({'food': 1, 'gold': 1}), FixedRatioPolicy({'food': 2, 'gold': 1})
+    >>> for policy, finish_time in ((half, 1100), (third, 1000)):
+    ...     store.put([(store.make_key({'food':1000, 'gold':800}, 10, policy=policy),
+    ...                 dict(row, policy='fixed_ratio', finish_time=finish_time))], policy=policy)
+    >>> list(store.query({'food':1000, 'gold':800}, policy=third)) # policies of the same name are kept apart
+    [(10, 1000)]
+    """
+
+    def __init__(self, path, mmap_size=256 * 1024 * 1024):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA mmap_size = %d' % mmap_size)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, %s)' % ', '.join(COLUMNS[1:]))
+        self.connection.execute('CREATE INDEX IF NOT EXISTS results_goal ON results (config, %s)'
+                                % ', '.join('goal_' + key for key in RESOURCE_TYPES))
+
+    def __len__(self):
+        return self.connection.execute('SELECT count(*) FROM results').fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def make_key(self, resource_goal, num_villager, running_time=constants.DEFAULT_RUNNING_TIME, policy=None,
+                 rules=None):
+        # the same point always gets the same key, whatever the order or the missing zeros of the goal
+        goal = [resource_goal.get(key, 0) for key in RESOURCE_TYPES]
+        point = [goal, num_villager, running_time, make_policy(policy).key(), config_hash(rules)]
+        return hashlib.sha256(json.dumps(point).encode()).hexdigest()
+
+    def get(self, keys):
+        # {key: row} of the keys found in the store, rows are in the form of run_sweep
+        found = {}
+        keys = list(keys)
+        for start in range(0, len(keys), MAX_PARAMETERS):
+            chunk = keys[start:start + MAX_PARAMETERS]
+            cursor = self.connection.execute('SELECT %s FROM results WHERE key IN (%s)'
+                                             % (', '.join(COLUMNS), ', '.join('?' * len(chunk))), chunk)
+            for record in cursor:
+                found[record[0]] = self.make_row(record)
+        return found
+
+    def put(self, keyed_rows, running_time=constants.DEFAULT_RUNNING_TIME, rules=None, policy=None):
+        # insert (key, row) pairs of the same running time, rules and policy in a single transaction
+        # the policy column holds policy.key(), the name is not enough (e.g. every FixedRatioPolicy is 'fixed_ratio')
+        config, policy_key = config_hash(rules), policy_column(policy)
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO results VALUES (%s)' % ', '.join('?' * len(COLUMNS)),
+                                        (self.make_record(key, row, config, running_time, policy_key)
+                                         for key, row in keyed_rows))
+
+    def make_record(self, key, row, config, running_time, policy_key):
+        return ([key, config, policy_key, row['rules'], row['num_villager'], running_time, row['finish_time'],
+                 row['status']]
+                + [row['goal'][resource] for resource in RESOURCE_TYPES]
+                + [row['resources'][resource] for resource in RESOURCE_TYPES]
+                + [row['labor_division'][resource] for resource in RESOURCE_TYPES])
+
+    def make_row(self, record):
+        goal, resources, labor = record[8:12], record[12:16], record[16:20]
+        return {'goal': dict(zip(RESOURCE_TYPES, goal)), 'policy': json.loads(record[2])[0], 'rules': record[3],
+                'num_villager': record[4], 'finish_time': record[6], 'status': record[7],
+                'resources': dict(zip(RESOURCE_TYPES, resources)), 'labor_division': dict(zip(RESOURCE_TYPES, labor))}
+
+    def query(self, resource_goal, policy='greedy', columns=('num_villager', 'finish_time'),
+              running_time=constants.DEFAULT_RUNNING_TIME, rules=None):
+        # a cursor over the stored points of one goal, policy and ruleset by villager count, yielding tuples of columns
+        # (nothing is loaded before it is iterated), e.g. to plot a large sweep straight from the file
+        unknown = set(columns) - set(COLUMNS)
+        if unknown:
+            raise ValueError('unknown columns %s' % sorted(unknown))
+        goal = [resource_goal.get(key, 0) for key in RESOURCE_TYPES]
+        return self.connection.execute(
+            'SELECT %s FROM results WHERE config = ? AND %s AND policy = ? AND running_time = ? ORDER BY num_villager'
+            % (', '.join(columns), ' AND '.join('goal_%s = ?' % key for key in RESOURCE_TYPES)),
+            [config_hash(rules)] + goal + [policy_column(policy), running_time])
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+from types import MappingProxyType
+
+
+# the numbers of the game are data, not code: a ruleset is read from a JSON file like default_rules.json,
+# so rule variants like civilization bonuses or technologies can be simulated without editing the simulators
+
+RESOURCE_TYPES = ('food', 'wood', 'gold', 'stone')
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'default_rules.json')
+SCALAR_RULES = ('initial_accommodation', # a town center accommodates 5 people
+                'accommodation_per_house',
+                'villager_training_time', # seconds to train a villager
+                'try_train_villager_interval', # if there is not enough food to train a villager, try again after this
+                'food_cost_per_villager',
+                'wood_cost_per_house',
+                'wood_cost_per_farm', # one farmer works on one farm
+                'wood_cost_per_food', # farms "exhaust continuously", this much wood is deducted per unit of food
+                'wood_for_other_buildings') # wood set aside for the other buildings when estimating the wood needed
+RESOURCE_RULES = ('initial_resources', 'work_interval', 'max_capacity') # {resource: value}
+TABLE_RULES = RESOURCE_RULES + ('build_time',) # build_time is {building: seconds}
+
+
+class Ruleset:
+    """
+    The rules of the game compiled once into read-only lookup tables: the scalar rules as attributes, the
+    resource rules as dicts in the order of RESOURCE_TYPES and as flat tuples (work_intervals, max_capacities)
+    a ruleset never changes, so one object is shared by every simulator (and sweep worker) using it,
+    variant() makes a new ruleset with some rules changed
+    >>> DEFAULT_RULES.work_interval['wood'], DEFAULT_RULES.work_intervals, DEFAULT_RULES.food_cost_per_villager
+    (25, (32, 25, 26, 27), 50)
+    >>> wheelbarrow = DEFAULT_RULES.variant('wheelbarrow', max_capacity={'food': 13, 'wood': 13, 'gold': 13})
+    >>> wheelbarrow.max_capacities, wheelbarrow.work_interval['food'], wheelbarrow.key() == DEFAULT_RULES.key()
+    ((13, 13, 13, 10), 32, False)
+    >>> DEFAULT_RULES.wood_cost_per_farm = 0
+    Traceback (most recent call last):
+    ...
+    AttributeError: a Ruleset is read-only, use variant()
+    """
+    __slots__ = ('name', 'data', 'digest', 'work_intervals', 'max_capacities') + SCALAR_RULES + TABLE_RULES
+
+    def __init__(self, data, name=None):
+        missing = [rule for rule in SCALAR_RULES + TABLE_RULES if rule not in data]
+        if missing:
+            raise ValueError('missing rules: %s' % ', '.join(missing))
+        define = object.__setattr__ # the only way to set attributes, see __setattr__
+        name = data.get('name', 'custom') if name is None else name
+        data = json.loads(json.dumps({rule: data[rule] for rule in SCALAR_RULES + TABLE_RULES})) # a private copy
+        define(self, 'name', name)
+        define(self, 'data', data)
+        for rule in SCALAR_RULES:
+            define(self, rule, data[rule])
+        for rule in RESOURCE_RULES:
+            define(self, rule, MappingProxyType({key: data[rule][key] for key in RESOURCE_TYPES}))
+        define(self, 'build_time', MappingProxyType(dict(data['build_time'])))
+        define(self, 'work_intervals', tuple(self.work_interval.values()))
+        define(self, 'max_capacities', tuple(self.max_capacity.values()))
+        # the name is left out, the same rules give the same results whatever they are called
+        define(self, 'digest', hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()[:16])
+
+    def __setattr__(self, name, value):
+        raise AttributeError('a Ruleset is read-only, use variant()')
+
+    def __repr__(self):
+        return 'Ruleset(%r)' % self.name
+
+    def __reduce__(self): # pickled as its data, e.g. when sent to a worker process
+        return Ruleset, (self.data, self.name)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo): # snapshots of a simulator share its ruleset
+        return self
+
+    def key(self):
+        return self.digest
+
+    def variant(self, name, **changes):
+        # a new ruleset with some rules changed, the tables only need the changed entries, e.g.
+        # variant('fast_wood', work_interval={'wood': 20}, wood_cost_per_house=20)
+        data = json.loads(json.dumps(self.data))
+        for rule, value in changes.items():
+            if rule not in data:
+                raise ValueError('unknown rule %r' % rule)
+            if rule in TABLE_RULES:
+                data[rule].update(value)
+            else:
+                data[rule] = value
+        return Ruleset(data, name)
+
+
+def load_ruleset(path):
+    # a ruleset from a JSON file, named after the file if the file does not name it
+    with open(path) as file:
+        data = json.load(file)
+    return Ruleset(data, data.get('name', os.path.splitext(os.path.basename(path))[0]))
+
+
+DEFAULT_RULES = load_ruleset(DEFAULT_RULES_FILE)
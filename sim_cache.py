@@ -0,0 +1,53 @@
+from collections import OrderedDict
+
+
+class SimulationCache:
+    """
+    Cache of complex_sim prefixes, so that sweeps over num_villager do not replay the same history again and again
+    complex_sim(n) and complex_sim(n + 1) are identical until the first time a villager is trained and the population
+    reaches n, so for each (resource goal, initial resources, running_time, policy, rules) we keep a chain of snapshots
+    taken right before each "train another villager?" decision, together with the population at that moment and the
+    state of the early stop checks made since the previous snapshot (they depend on n, so a resumed run checks them
+    again, see complex_sim)
+    the least recently used chains are evicted when there are more than max_chains
+    >>> from aoe_sim import AoeSimulator
+    >>> cache = SimulationCache()
+    >>> finish_times = []
+    >>> for n in [10, 15, 20]:
+    ...     sim = AoeSimulator()
+    ...     sim.set_resource_goal({'food':1000, 'gold':800})
+    ...     finish_times.append(sim.complex_sim(n, return_value=True, verbose=False, cache=cache))
+    >>> finish_times
+    [960, 800, 769]
+    >>> chain = next(iter(cache.chains.values()))
+    >>> [population for population, _, _, _ in chain][:4]
+    [5, 6, 7, 8]
+    """
+
+    def __init__(self, max_chains=64):
+        self.max_chains = max_chains
+        self.chains = OrderedDict()
+
+    def make_key(self, sim):
+        # everything the history of a simulation depends on
+        return (tuple(sorted(sim.resource_goal.items())), tuple(sim.resources.items()), sim.running_time,
+                sim.policy.key(), sim.rules.key(), sim.scheduler, sim.wake_on_food)
+
+    def get_chain(self, sim):
+        # the list of (population, decision_time, snapshot, checks) for this simulation, created empty if not cached yet
+        key = self.make_key(sim)
+        if key in self.chains:
+            self.chains.move_to_end(key)
+        else:
+            self.chains[key] = []
+            if len(self.chains) > self.max_chains:
+                self.chains.popitem(last=False) # evict the least recently used chain
+        return self.chains[key]
+
+    def resume_point(self, chain, num_villager):
+        # the latest snapshot whose history is shared by a run with num_villager: the first decision where
+        # that run stops training villagers, or the last decision cached if it never stops there
+        for i, (population, _, _, _) in enumerate(chain):
+            if population >= num_villager:
+                return i
+        return len(chain) - 1
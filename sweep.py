@@ -0,0 +1,233 @@
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import csv
+import json
+import os
+from aoe_sim import AoeSimulator
+from policy import POLICIES, FixedRatioPolicy, make_policy
+from result_store import ResultStore
+from ruleset import DEFAULT_RULES, load_ruleset
+from sim_cache import SimulationCache
+from constants import DEFAULT_RUNNING_TIME
+
+RESOURCE_TYPES = ('food', 'wood', 'gold', 'stone')
+
+SWEEP_CACHE = SimulationCache() # one per process, consecutive villager counts in a chunk share their prefix
+SWEEP_RULES = [DEFAULT_RULES] # the rulesets of the current sweep, tasks refer to them by index
+
+
+def install_rules(rulesets):
+    # every worker process receives the rulesets of a sweep once when it starts (forked workers inherit them
+    # without a copy), so a task only carries an index and nothing is parsed or copied per simulation
+    SWEEP_RULES[:] = rulesets
+
+
+def simulate_point(task):
+    # run one complex_sim for a (resource_goal, num_villager, running_time, policy, rules index) task and return one
+    # row of the result table, it is a module level function so that it can be sent to the worker processes
+    resource_goal, num_villager, running_time, policy, rules_index = task
+    sim = AoeSimulator(running_time, policy, SWEEP_RULES[rules_index])
+    sim.set_resource_goal(dict(resource_goal)) # copy, set_resource_goal fills the missing keys in place
+    finish_time = sim.complex_sim(num_villager, return_value=True, verbose=False, cache=SWEEP_CACHE)
+    return {'goal': sim.resource_goal, 'policy': sim.policy.name, 'rules': sim.rules.name, 'num_villager': num_villager,
+            'finish_time': finish_time, 'status': sim.status, 'resources': sim.resources,
+            'labor_division': sim.labor_division}
+
+
+def run_sweep(resource_goals, villager_counts, max_workers=None, chunksize=None, running_time=DEFAULT_RUNNING_TIME,
+              policies=None, store=None, rulesets=None):
+    """
+    Run complex_sim for every combination of resource goal, ruleset, allocation policy and villager count
+    the runs are independent, so they are fanned out over a ProcessPoolExecutor in chunks
+    :param resource_goals: a list of resource goals, e.g [{'food':1000, 'gold':800}, {'food':500}]
+    :param villager_counts: the numbers of villagers to try, e.g range(10, 101)
+    :param max_workers: number of worker processes, None uses all cores, 1 runs everything in this process
+    :param chunksize: number of runs sent to a worker at once, None splits the grid into about 4 chunks per worker
+    :param policies: a list of allocation policies (names or objects, see policy.py), None for the greedy one only
+    :param store: a ResultStore (see result_store.py), points found in it are not simulated again, new ones are added
+    :param rulesets: a list of game rules (Ruleset objects, see ruleset.py), None for the default rules only
+    :return: a list of rows (dicts with goal, policy, rules, num_villager, finish_time, status, resources,
+    labor_division), ordered by goal, then ruleset, then policy, then villager count,
+    finish_time is None if the goal is not met within running_time,
+    then status tells why ('infeasible' runs stop as soon as the goal is out of reach, see complex_sim)
+    >>> table = run_sweep([{'food':1000, 'gold':800}], [10, 15, 20], max_workers=1)
+    >>> [row['finish_time'] for row in table]
+    [960, 800, 769]
+    >>> table[1]['labor_division']
+    {'food': 8, 'wood': 4, 'gold': 3, 'stone': 0}
+    >>> run_sweep([{'food':1000, 'gold':800}], [10, 15, 20], max_workers=2) == table
+    True
+    >>> table = run_sweep([{'food':1000, 'gold':800}], [20], max_workers=1, policies=['round_robin', 'lookahead'])
+    >>> [(row['policy'], row['finish_time']) for row in table]
+    [('round_robin', 1150), ('lookahead', 758)]
+    >>> [(row['finish_time'], row['status']) for row in run_sweep([{'stone':20000}], [10, 60], max_workers=1)]
+    [(None, 'infeasible'), (2719, 'goal_met')]
+    >>> fast = DEFAULT_RULES.variant('fast_training', villager_training_time=20)
+    >>> table = run_sweep([{'food':1000, 'gold':800}], [10, 20], max_workers=2, rulesets=[DEFAULT_RULES, fast])
+    >>> [(row['rules'], row['finish_time']) for row in table]
+    [('default', 960), ('default', 769), ('fast_training', 950), ('fast_training', 754)]
+    >>> from result_store import ResultStore
+    >>> store = ResultStore(':memory:')
+    >>> [row['finish_time'] for row in run_sweep([{'food':1000, 'gold':800}], [10, 15], max_workers=1, store=store)]
+    [960, 800]
+    >>> table = run_sweep([{'food':1000, 'gold':800}], [15, 20], max_workers=1, store=store) # 15 is read from the store
+    >>> len(store), table == run_sweep([{'food':1000, 'gold':800}], [15, 20], max_workers=1)
+    (3, True)
+    >>> alias = DEFAULT_RULES.variant('alias') # the same rules under another name
+    >>> [row['rules'] for row in run_sweep([{'food':1000}], [10], max_workers=1, rulesets=[DEFAULT_RULES, alias],
+    ...                                    store=store)]
+    ['default', 'alias']
+    """
+    policies = [None] if policies is None else policies
+    rulesets = [DEFAULT_RULES] if rulesets is None else list(rulesets)
+    tasks = [(goal, n, running_time, policy, rules_index) for goal in resource_goals
+             for rules_index in range(len(rulesets)) for policy in policies for n in villager_counts]
+    if store is None:
+        return simulate_points(tasks, rulesets, max_workers, chunksize)
+
+    keys = [store.make_key(goal, n, running_time, policy, rulesets[rules_index])
+            for goal, n, running_time, policy, rules_index in tasks]
+    found = store.get(keys)
+    missing = {}
+    for key, task in zip(keys, tasks):
+        if key not in found:
+            missing.setdefault(key, task) # the same point may appear twice in the grid
+    computed = dict(zip(missing, simulate_points(list(missing.values()), rulesets, max_workers, chunksize)))
+    for rules_index, rules in enumerate(rulesets):
+        for policy in policies:
+            store.put([(key, row) for key, row in computed.items()
+                       if missing[key][4] == rules_index and missing[key][3] is policy], running_time, rules, policy)
+    found.update(computed)
+    # the store keeps one order of the goal keys, and the name of the first ruleset with these rules (the key only
+    # has the rules themselves), give every row its goal as complex_sim would have it and the name of its ruleset
+    return [dict(found[key], goal=full_goal(task[0]), rules=rulesets[task[4]].name) for key, task in zip(keys, tasks)]
+
+
+def full_goal(resource_goal):
+    sim = AoeSimulator()
+    sim.set_resource_goal(dict(resource_goal))
+    return sim.resource_goal
+
+
+def simulate_points(tasks, rulesets, max_workers=None, chunksize=None):
+    # rows of the tasks in the same order, see run_sweep
+    if not tasks:
+        return []
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = min(max_workers, len(tasks))
+    if max_workers <= 1: # not worth starting a pool
+        install_rules(rulesets)
+        return [simulate_point(task) for task in tasks]
+
+    if chunksize is None:
+        chunksize = max(1, len(tasks) // (max_workers * 4))
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=install_rules, initargs=(rulesets,)) as executor:
+        return list(executor.map(simulate_point, tasks, chunksize=chunksize))
+
+
+# headless command line entry point, no matplotlib unless --plot is given, e.g.
+# python sweep.py --goal food=5000 wood=4000 gold=4000 stone=1500 --villagers 10 100 --output results.csv
+
+
+def parse_goal(items):
+    """
+    >>> parse_goal(['food=1000', 'gold=800'])
+    {'food': 1000, 'gold': 800}
+    """
+    goal = {}
+    for item in items:
+        key, _, value = item.partition('=')
+        if key not in RESOURCE_TYPES or not value.isdigit():
+            raise ValueError('a goal is given as resource=amount, got %r' % item)
+        goal[key] = int(value)
+    return goal
+
+
+def parse_policy(text):
+    """
+    A policy name in POLICIES, or fixed_ratio:RESOURCE=WEIGHT,... for a FixedRatioPolicy
+    >>> parse_policy('lookahead')
+    'lookahead'
+    >>> parse_policy('fixed_ratio:food=2,wood=1,gold=1').share
+    {'food': 0.5, 'wood': 0.25, 'gold': 0.25}
+    """
+    name, _, ratio = text.partition(':')
+    if name != FixedRatioPolicy.name:
+        make_policy(text) # a ValueError if it is not a name in POLICIES
+        return text
+    weights = {}
+    for item in ratio.split(',') if ratio else []:
+        key, _, value = item.partition('=')
+        if key not in RESOURCE_TYPES or not value.isdigit():
+            raise ValueError('a ratio is given as resource=weight, got %r' % item)
+        weights[key] = int(value)
+    if not sum(weights.values()):
+        raise ValueError('fixed_ratio needs a ratio, e.g. fixed_ratio:food=4,wood=3,gold=2,stone=1')
+    return FixedRatioPolicy(weights)
+
+
+def flat_row(row):
+    # one result row as a flat dict, for a csv file
+    flat = {'goal_' + key: row['goal'][key] for key in RESOURCE_TYPES}
+    flat.update(policy=row['policy'], rules=row['rules'], num_villager=row['num_villager'],
+                finish_time=row['finish_time'], status=row['status'])
+    flat.update({key: row['resources'][key] for key in RESOURCE_TYPES})
+    flat.update({'labor_' + key: row['labor_division'][key] for key in RESOURCE_TYPES})
+    return flat
+
+
+def write_results(table, path):
+    # a csv file if the path ends with .csv, json otherwise
+    if path.endswith('.csv'):
+        with open(path, 'w', newline='') as file:
+            rows = [flat_row(row) for row in table]
+            writer = csv.DictWriter(file, fieldnames=list(rows[0]) if rows else [])
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(path, 'w') as file:
+            json.dump(table, file, indent=1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run complex_sim over a grid of goals and villager counts.')
+    parser.add_argument('--goal', nargs='+', action='append', required=True, metavar='RESOURCE=AMOUNT',
+                        help='a resource goal, repeat --goal for several goals')
+    parser.add_argument('--villagers', nargs=2, type=int, default=[10, 100], metavar=('LOW', 'HIGH'),
+                        help='range of villager counts, both included')
+    parser.add_argument('--policy', nargs='+', default=None, metavar='POLICY',
+                        help='allocation policies, greedy by default: %s or fixed_ratio:food=4,wood=3,...'
+                             % ', '.join(POLICIES))
+    parser.add_argument('--rules', nargs='+', default=None, metavar='FILE',
+                        help='game rules as JSON files like default_rules.json, the default rules if not given')
+    parser.add_argument('--running-time', type=int, default=DEFAULT_RUNNING_TIME)
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, 1 runs in this process')
+    parser.add_argument('--output', required=True, help='result file, .csv or .json')
+    parser.add_argument('--plot', help='also save the graph of the first goal and policy to this image file')
+    parser.add_argument('--store', help='SQLite result store, points already in it are not simulated again')
+    args = parser.parse_args(argv)
+
+    try:
+        goals = [parse_goal(items) for items in args.goal]
+        policies = [parse_policy(text) for text in args.policy] if args.policy else None
+    except ValueError as error:
+        parser.error(str(error))
+    low, high = args.villagers
+    if low > high:
+        parser.error('--villagers LOW HIGH needs LOW <= HIGH, got %d %d' % (low, high))
+    rulesets = [load_ruleset(path) for path in args.rules] if args.rules else None
+    store = ResultStore(args.store) if args.store else None
+    table = run_sweep(goals, range(low, high + 1), max_workers=args.workers, running_time=args.running_time,
+                      policies=policies, store=store, rulesets=rulesets)
+    if store is not None:
+        store.close()
+    write_results(table, args.output)
+    if args.plot:
+        from plotting import plot_finish_times
+        first = table[:high - low + 1]
+        plot_finish_times(first[0]['goal'], range(low, high + 1), [row['finish_time'] for row in first], args.plot)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,48 +1,51 @@
 import random as rd
+from ruleset import DEFAULT_RULES
 
 
 # the reference data of AOE gather speed: https://ageofempires.fandom.com/wiki/Villager_(Age_of_Empires_II)
 
 class Villager:
-    def __init__(self, init_time): #
+    # the rates come from a ruleset (see ruleset.py), the default rules if none is given,
+    # a plain Villager gathers nothing, so it has no rates
+    __slots__ = ('init_time', 'max_capacity', 'work_interval') # no per-object dict
+    resource_type = None
+
+    def __init__(self, init_time, rules=None): #
+        rules = DEFAULT_RULES if rules is None else rules
         self.init_time = init_time
-        self.max_capacity = 10 # take 10 unit of capacity maximum
-        self.resource_type = None
+        if self.resource_type is not None:
+            self.max_capacity = rules.max_capacity[self.resource_type] # take 10 unit of capacity maximum by default
+            self.work_interval = rules.work_interval[self.resource_type] # seconds until a load is full
 
 
 class Farmer(Villager):
     # for simplicity, Forager, Fisherman, Shepherd, Hunter are all combined into farmer for now
-    def __init__(self, init_time):
-        super().__init__(init_time)
-        self.resource_type= 'food'
-        self.work_interval = 32 # resource reach max every 32.2 s
+    __slots__ = ()
+    resource_type = 'food'
 
 
 class Lumberjack(Villager):
-    def __init__(self, init_time):
-        super().__init__(init_time)
-        self.resource_type= 'wood'
-        self.work_interval = 25
+    __slots__ = ()
+    resource_type = 'wood'
 
 
 class GoldMiner(Villager):
-    def __init__(self, init_time):
-        super().__init__(init_time)
-        self.resource_type= 'gold'
-        self.work_interval = 26
+    __slots__ = ()
+    resource_type = 'gold'
 
 
 class StoneMiner(Villager):
-    def __init__(self, init_time):
-        super().__init__(init_time)
-        self.resource_type= 'stone'
-        self.work_interval = 27
+    __slots__ = ()
+    resource_type = 'stone'
 
 
 class Builder(Villager):
-    def __init__(self, init_time, building):
-        super().__init__(init_time)
-        self.resource_type = None
+    __slots__ = ('building_type',)
+
+    def __init__(self, init_time, building, rules=None):
+        rules = DEFAULT_RULES if rules is None else rules
+        self.init_time = init_time
+        self.max_capacity = 0 # a builder carries nothing
         self.building_type = building
-        if building == 'house':
-            self.work_interval = 25
\ No newline at end of file
+        if building in rules.build_time: # buildings the rules do not know have no build time yet
+            self.work_interval = rules.build_time[building]